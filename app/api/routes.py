@@ -1,17 +1,68 @@
 from fastapi import APIRouter, HTTPException, status
-from app.models.requests import VisitorParseRequest
-from app.models.responses import VisitorParseResponse, VisitorParseSuccessResponse, VisitorParseErrorResponse, ErrorResponse
+from fastapi.responses import ORJSONResponse, Response
+from app.models.requests import VisitorParseRequest, VisitorParseBatchRequest
+from app.models.whizprop import MAIN_CATEGORIES, SUB_CATEGORIES
+from app.models.responses import VisitorParseSuccessResponse, VisitorParseErrorResponse, VisitorParseBatchResponse, ErrorResponse
 from app.services.parser_service import visitor_parser
+from app.api.etag import compute_etag
+from typing import Dict, Tuple
+import asyncio
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Full path of the health endpoint once mounted under /api/v1 (answered directly by HealthShortcut in main.py)
+HEALTH_PATH = "/api/v1/health"
+
+# Static payloads are serialized once at import time and served as raw bytes
+_HEALTH_BYTES = orjson.dumps({
+    "status": "healthy",
+    "service": "AI Visitor Registration API",
+    "version": "1.0.0"
+})
+
+_CATEGORIES_BYTES = orjson.dumps({
+    "main_categories": [
+        {
+            "name_chi": category.name_chi,
+            "name_eng": category.name_eng,
+            "has_subcategories": category.has_subcategories,
+            "subcategories": [
+                {"name_chi": sub.name_chi, "name_eng": sub.name_eng}
+                for sub in SUB_CATEGORIES.values()
+                if sub.parent_category == category.name_chi
+            ]
+        }
+        for category in MAIN_CATEGORIES.values()
+    ]
+})
+_CATEGORIES_ETAG = compute_etag(_CATEGORIES_BYTES)
+
+# In-flight parse tasks keyed by (building_id, text) so identical concurrent requests share one upstream call
+_inflight: Dict[Tuple[int, str], asyncio.Task] = {}
+
+
+async def _parse_coalesced(building_id: int, text: str):
+    """Parse visitor info, joining an identical in-flight request if one exists."""
+    key = (building_id, text)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(visitor_parser.parse_visitor_info(building_id, text))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        logger.info("Joining in-flight parse request for building %s", building_id)
+    
+    # Shield so a disconnecting caller does not cancel the shared task for the others
+    return await asyncio.shield(task)
+
 
 @router.post(
     "/parse-visitor",
-    response_model=VisitorParseResponse,
+    response_model=None,  # Handler serializes itself; skips FastAPI re-validating the response union
     status_code=status.HTTP_200_OK,
     summary="Parse visitor information from text",
     description="""
@@ -28,52 +79,64 @@ router = APIRouter()
     - 外賣 (Delivery): Food delivery with subcategories (FoodPanda, Keeta)
     """,
     responses={
-        200: {"description": "Successfully parsed visitor information"},
-        400: {"description": "Invalid request data"},
-        422: {"description": "Validation error"},
+        200: {"model": VisitorParseSuccessResponse, "description": "Successfully parsed visitor information"},
+        422: {"description": "Validation error (e.g. blank text or non-positive building ID)"},
         500: {"description": "Internal server error"}
     }
 )
 async def parse_visitor(request: VisitorParseRequest):
     """Parse visitor information from text input."""
-    try:
-        logger.info(f"Received parse request for building {request.building_id}")
-        
-        # Validate input
-        if not request.text.strip():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Text input cannot be empty"
-            )
-        
-        if request.building_id <= 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Building ID must be positive"
-            )
-        
-        # Parse visitor information
-        result = await visitor_parser.parse_visitor_info(request.building_id, request.text)
-        
-        # Handle error responses
-        if isinstance(result, VisitorParseErrorResponse):
-            logger.error(f"Parsing failed: {result.message}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=result.message
-            )
-        
-        logger.info(f"Successfully parsed visitor info with confidence: {result.confidence}")
-        return result
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error in parse_visitor: {str(e)}")
+    logger.info("Received parse request for building %s", request.building_id)
+    
+    # Input is already validated by VisitorParseRequest (positive building ID, non-blank text).
+    # Unexpected errors are handled by the app-level exception handler.
+    result = await _parse_coalesced(request.building_id, request.text)
+    
+    # Handle error responses
+    if isinstance(result, VisitorParseErrorResponse):
+        logger.error("Parsing failed: %s", result.message)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Internal server error: {str(e)}"
+            detail=result.message
         )
+    
+    logger.info("Successfully parsed visitor info with confidence: %s", result.confidence)
+    return ORJSONResponse(content=result.model_dump(), status_code=status.HTTP_200_OK)
+
+
+@router.post(
+    "/parse-visitor/batch",
+    response_model=None,  # Handler serializes itself
+    status_code=status.HTTP_200_OK,
+    summary="Parse several visitor texts in one request",
+    description="""
+    Parse up to 20 visitor texts in one call. Each building's data is fetched
+    once for all items that share it, and the AI calls run concurrently.
+    
+    Results are returned in request order. A failed item is reported as an
+    error entry in `results` and does not fail the rest of the batch.
+    """,
+    responses={
+        200: {"model": VisitorParseBatchResponse, "description": "Per-item parse results"},
+        422: {"description": "Validation error (e.g. empty or oversized batch)"},
+        500: {"description": "Internal server error"}
+    }
+)
+async def parse_visitor_batch(request: VisitorParseBatchRequest):
+    """Parse several visitor texts, sharing building data fetches across items."""
+    logger.info("Received batch parse request with %s items", len(request.items))
+    
+    results = await visitor_parser.parse_many([(item.building_id, item.text) for item in request.items])
+    
+    content = []
+    for result in results:
+        if isinstance(result, BaseException):
+            # The single-item endpoint would answer this with a 500; keep the other items
+            logger.error("Unexpected error in batch item: %s", result)
+            result = VisitorParseErrorResponse(message="Internal server error")
+        content.append(result.model_dump())
+    
+    return ORJSONResponse(content={"status": "success", "results": content}, status_code=status.HTTP_200_OK)
 
 
 @router.get(
@@ -86,11 +149,7 @@ async def parse_visitor(request: VisitorParseRequest):
 )
 async def health_check():
     """Health check endpoint."""
-    return {
-        "status": "healthy",
-        "service": "AI Visitor Registration API",
-        "version": "1.0.0"
-    }
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
 
 
 @router.get(
@@ -103,22 +162,8 @@ async def health_check():
 )
 async def get_categories():
     """Get available visit categories."""
-    return {
-        "main_categories": [
-            {
-                "name_chi": "探訪",
-                "name_eng": "Visit",
-                "has_subcategories": False,
-                "subcategories": []
-            },
-            {
-                "name_chi": "外賣", 
-                "name_eng": "Delivery",
-                "has_subcategories": True,
-                "subcategories": [
-                    {"name_chi": "熊猫", "name_eng": "FoodPanda"},
-                    {"name_chi": "美團", "name_eng": "Keeta"}
-                ]
-            }
-        ]
-    } 
\ No newline at end of file
+    return Response(
+        content=_CATEGORIES_BYTES,
+        media_type="application/json",
+        headers={"ETag": _CATEGORIES_ETAG}
+    )
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional
 import os
 from pathlib import Path
 
@@ -11,11 +12,28 @@ class Settings(BaseSettings):
     app_name: str = "AI Visitor Registration API"
     app_version: str = "1.0.0"
     debug: bool = False
+    log_level: Optional[str] = None  # Defaults to INFO in debug mode, WARNING otherwise
+    profiling: bool = False  # Enable ?profile=1 pyinstrument reports (requires pyinstrument)
+    
+    # CORS Configuration (JSON list in env, e.g. CORS_ORIGINS='["https://example.com"]')
+    cors_origins: List[str] = ["https://propman.necess.com.hk"]  # n8n host
     
     # AI Provider Configuration
     ai_provider: str = "gemini"  # "gemini" or "openrouter"
     ai_model: str = "gemini-2.5-flash"  # Direct Gemini API model
     
+    # Seconds to reuse fetched WhizProp building data (0 disables caching)
+    building_cache_ttl: float = 900.0
+    
+    # Seconds before expiry at which a cached building is refreshed in the background
+    building_cache_refresh_ahead: float = 300.0
+    
+    # Maximum concurrent n8n webhook calls per process
+    max_concurrent_gemini: int = 4
+    
+    # Maximum concurrent WhizProp API calls per process (match the HTTP keepalive pool)
+    max_concurrent_whizprop: int = 20
+    
     # Gemini AI Configuration (for direct API access)
     gemini_api_key: str = os.getenv("GEMINI_API_KEY", "")
     
@@ -44,6 +62,11 @@ class Settings(BaseSettings):
         """Get base URL from whizprop configuration."""
         return self.whizprop_base_url or "https://whizprop-tablet.necess.com.hk"
     
+    @property
+    def effective_log_level(self) -> str:
+        """Get log level, quieter by default outside debug mode."""
+        return (self.log_level or ("INFO" if self.debug else "WARNING")).upper()
+    
     @property
     def effective_device_id(self) -> Optional[str]:
         """Get device ID from whizprop configuration."""
@@ -58,8 +81,9 @@ class Settings(BaseSettings):
 
 
 # Global settings instance
-def get_settings():
-    """Get a fresh settings instance."""
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the process-wide settings instance (env and .env files are read only once)."""
     return Settings()
 
 settings = get_settings() 
\ No newline at end of file
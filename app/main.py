@@ -1,23 +1,98 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from app.api.routes import router as api_router
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
+from app.api.routes import router as api_router, HEALTH_PATH, _HEALTH_BYTES
+from app.api.etag import compute_etag, etag_matches
 from app.config.settings import settings
+from app.services.gemini_service import GeminiService
+from app.services.parser_service import visitor_parser
+from app.services.whizprop_client import WhizPropClient
+from contextlib import asynccontextmanager
+import httpx
 import logging
+import logging.handlers
+import orjson
+import queue
 import time
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Configure logging: the request path only enqueues records, a background
+# listener thread does the actual stream I/O off the event loop
+# (QueueHandler formats records before enqueueing them, so it owns the formatter)
+_log_queue = queue.SimpleQueue()
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(
+    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 )
+logging.basicConfig(level=settings.effective_log_level, handlers=[_queue_handler])
+log_listener = logging.handlers.QueueListener(
+    _log_queue, logging.StreamHandler(), respect_handler_level=True
+)
+
+_log_listener_running = False
+
+
+def start_log_listener():
+    """Start draining the log queue; safe to call when already running."""
+    global _log_listener_running
+    if not _log_listener_running:
+        log_listener.start()
+        _log_listener_running = True
+
+
+def stop_log_listener():
+    """Flush queued records and stop the listener thread; safe to call when stopped."""
+    global _log_listener_running
+    if _log_listener_running:
+        log_listener.stop()
+        _log_listener_running = False
+
+
+# Started at import so records logged before the first lifespan are written too
+start_log_listener()
 
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown."""
+    # A previous lifespan in this process may have stopped the listener
+    start_log_listener()
+    logger.info("Starting %s v%s", settings.app_name, settings.app_version)
+    logger.info("Debug mode: %s", settings.debug)
+    
+    # One pooled client keeps connections alive across WhizProp and n8n calls;
+    # HTTP/2 is negotiated via ALPN so concurrent calls share one connection
+    app.state.http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+    )
+    # Created inside the running loop and warmed so the first request skips the TLS handshake
+    app.state.whizprop_client = WhizPropClient(http_client=app.state.http_client)
+    app.state.gemini_service = GeminiService(http_client=app.state.http_client)
+    visitor_parser.use_whizprop_client(app.state.whizprop_client)
+    visitor_parser.use_gemini_service(app.state.gemini_service)
+    await app.state.gemini_service.warmup()
+    
+    yield
+    
+    logger.info("Shutting down %s", settings.app_name)
+    await app.state.whizprop_client.aclose()
+    await app.state.http_client.aclose()
+    # Flushes any queued records; the next lifespan (if any) restarts it
+    stop_log_listener()
+
 # Create FastAPI application
 app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+    # Interactive docs and the OpenAPI schema are only served in debug mode
+    docs_url="/docs" if settings.debug else None,
+    redoc_url=None,
+    openapi_url="/openapi.json" if settings.debug else None,
     description="""
     AI-Powered Visitor Registration API
     
@@ -51,34 +126,117 @@ app = FastAPI(
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["content-type", "authorization"],
+    max_age=86400,  # Let browsers cache preflight responses for 24h
 )
 
+# Add profiling middleware (only registered when profiling is enabled)
+if settings.profiling:
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+        logger.warning("PROFILING is enabled but pyinstrument is not installed (pip install pyinstrument); profiling is disabled")
+    
+    if Profiler is not None:
+        @app.middleware("http")
+        async def profile_request(request: Request, call_next):
+            if request.query_params.get("profile") != "1":
+                return await call_next(request)
+            
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+            await call_next(request)
+            profiler.stop()
+            return HTMLResponse(profiler.output_html())
+
+# Body headers a 304 must not carry; everything else (Cache-Control, Vary, CORS, ...) is kept
+_NOT_MODIFIED_DROP_HEADERS = frozenset((b"content-length", b"content-type", b"content-encoding", b"transfer-encoding"))
+
+# Add ETag middleware for GET endpoints
+@app.middleware("http")
+async def etag_responses(request: Request, call_next):
+    response = await call_next(request)
+    
+    if request.method != "GET" or response.status_code != 200:
+        return response
+    
+    # Routes serving precomputed payloads already carry their ETag
+    etag = response.headers.get("etag")
+    if etag is None:
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        etag = compute_etag(body)
+        # Rebuilt from the raw header list so repeated headers (e.g. Set-Cookie) survive
+        raw_headers = [(name, value) for name, value in response.raw_headers if name != b"content-length"]
+        response = Response(content=body, status_code=response.status_code)
+        response.raw_headers = raw_headers + [
+            (b"content-length", str(len(body)).encode()),
+            (b"etag", etag.encode())
+        ]
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        # A 304 carries the headers the 200 would have sent, minus the body ones
+        not_modified = Response(status_code=304)
+        not_modified.raw_headers = [
+            (name, value) for name, value in response.raw_headers
+            if name not in _NOT_MODIFIED_DROP_HEADERS
+        ]
+        return not_modified
+    
+    return response
+
 # Add request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    
-    # Log request
-    logger.info(f"Request: {request.method} {request.url}")
+    # Skip all timing and formatting work when INFO logging is disabled
+    # (liveness probes never get here, HealthShortcut answers them first)
+    if not logger.isEnabledFor(logging.INFO):
+        return await call_next(request)
     
-    # Process request
+    start = time.perf_counter_ns()
     response = await call_next(request)
     
-    # Log response
-    process_time = time.time() - start_time
-    logger.info(f"Response: {response.status_code} - {process_time:.2f}s")
+    # Single log line per request, emitted once the response is ready
+    logger.info(
+        "Request: %s %s -> %d %.2fms",
+        request.method,
+        request.url.path,
+        response.status_code,
+        (time.perf_counter_ns() - start) / 1e6
+    )
     
     return response
 
+class HealthShortcut:
+    """Raw ASGI middleware answering health probes before routing and the rest of the middleware chain."""
+    
+    _HEADERS = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(_HEALTH_BYTES)).encode())
+    ]
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == HEALTH_PATH and scope["method"] == "GET":
+            await send({"type": "http.response.start", "status": 200, "headers": self._HEADERS})
+            await send({"type": "http.response.body", "body": _HEALTH_BYTES})
+            return
+        await self.app(scope, receive, send)
+
+# Added last so it is the outermost middleware
+app.add_middleware(HealthShortcut)
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Global exception handler: {str(exc)}")
-    return JSONResponse(
+    logger.error("Global exception handler: %s", exc)
+    return ORJSONResponse(
         status_code=500,
         content={
             "status": "error",
@@ -90,34 +248,32 @@ async def global_exception_handler(request: Request, exc: Exception):
 # Include API routes
 app.include_router(api_router, prefix="/api/v1", tags=["visitor"])
 
+# Root endpoint payload never changes for the lifetime of the process
+_ROOT_BYTES = orjson.dumps({
+    "service": settings.app_name,
+    "version": settings.app_version,
+    "status": "running",
+    "docs": app.docs_url,
+    "health": HEALTH_PATH
+})
+
 # Root endpoint
 @app.get("/", tags=["system"])
 async def root():
     """Root endpoint with API information."""
-    return {
-        "service": settings.app_name,
-        "version": settings.app_version,
-        "status": "running",
-        "docs": "/docs",
-        "health": "/api/v1/health"
-    }
-
-# Startup event
-@app.on_event("startup")
-async def startup_event():
-    logger.info(f"Starting {settings.app_name} v{settings.app_version}")
-    logger.info(f"Debug mode: {settings.debug}")
-
-# Shutdown event  
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info(f"Shutting down {settings.app_name}")
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 if __name__ == "__main__":
+    import os
     import uvicorn
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
+        loop="uvloop",
+        http="httptools",
+        # Reload mode only supports a single worker
+        workers=1 if settings.debug else os.cpu_count(),
+        log_level="info" if settings.debug else "warning",
         reload=settings.debug
     ) 
\ No newline at end of file
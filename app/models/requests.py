@@ -1,17 +1,48 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional
 
 
 class VisitorParseRequest(BaseModel):
     """Request model for visitor information parsing."""
     
-    building_id: int = Field(..., description="WhizProp building ID", example=2)
-    text: str = Field(..., min_length=1, max_length=1000, description="Voice-to-text input containing visitor information", example="我叫李先生，送外賣到2座15樓A室，身份證A123")
-    
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        extra="ignore",
+        validate_assignment=False,
+        revalidate_instances="never",
+        populate_by_name=True,
+        str_strip_whitespace=True,  # Whitespace-only text fails min_length after stripping
+        json_schema_extra={
             "example": {
                 "building_id": 2,
                 "text": "我叫李先生，送外賣到2座15樓A室，身份證A123"
             }
-        } 
\ No newline at end of file
+        }
+    )
+    
+    building_id: int = Field(..., gt=0, description="WhizProp building ID", example=2)
+    text: str = Field(..., min_length=1, max_length=1000, description="Voice-to-text input containing visitor information", example="我叫李先生，送外賣到2座15樓A室，身份證A123")
+
+
+
+# Upper bound on texts per batch request, each costs one AI call
+MAX_BATCH_ITEMS = 20
+
+
+class VisitorParseBatchRequest(BaseModel):
+    """Request model for parsing several visitor texts in one call."""
+    
+    model_config = ConfigDict(
+        extra="ignore",
+        validate_assignment=False,
+        revalidate_instances="never",
+        json_schema_extra={
+            "example": {
+                "items": [
+                    {"building_id": 2, "text": "我叫李先生，送外賣到2座15樓A室，身份證A123"},
+                    {"building_id": 2, "text": "John Smith visiting Block 1, 10th floor, Flat C"}
+                ]
+            }
+        }
+    )
+    
+    items: List[VisitorParseRequest] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS, description="Texts to parse, each with its building ID")
@@ -2,9 +2,20 @@ from pydantic import BaseModel, Field, ConfigDict
 from typing import Optional, Dict, Any, Union, List
 
 
+# Fast-path config for hot request/response models: no assignment validation or instance revalidation
+_MODEL_CONFIG = ConfigDict(
+    extra="ignore",
+    validate_assignment=False,
+    revalidate_instances="never",
+    populate_by_name=True
+)
+
+
 class ExtractedData(BaseModel):
     """Extracted visitor data with IDs."""
     
+    model_config = _MODEL_CONFIG
+    
     block_id: Optional[int] = Field(None, description="WhizProp block ID")
     floor_id: Optional[int] = Field(None, description="WhizProp floor ID") 
     flat_id: Optional[int] = Field(None, description="WhizProp flat ID")
@@ -17,6 +28,8 @@ class ExtractedData(BaseModel):
 class RawExtracted(BaseModel):
     """Raw extracted information from Gemini AI."""
     
+    model_config = _MODEL_CONFIG
+    
     visitor_name: Optional[str] = None
     block_id: Optional[int] = None
     floor_id: Optional[int] = None
@@ -29,6 +42,8 @@ class RawExtracted(BaseModel):
 class VisitorParseSuccessResponse(BaseModel):
     """Success response model for visitor parsing."""
     
+    model_config = _MODEL_CONFIG
+    
     status: str = Field(default="success", description="Response status")
     data: ExtractedData = Field(..., description="Extracted and validated data")
     confidence: float = Field(..., ge=0, le=1, description="AI confidence score")
@@ -45,6 +60,13 @@ class VisitorParseErrorResponse(BaseModel):
 VisitorParseResponse = Union[VisitorParseSuccessResponse, VisitorParseErrorResponse]
 
 
+class VisitorParseBatchResponse(BaseModel):
+    """Response model for batch visitor parsing; results are in request order."""
+    
+    status: str = Field(default="success", description="Response status")
+    results: List[VisitorParseResponse] = Field(..., description="Per-item success or error response")
+
+
 class ErrorResponse(BaseModel):
     """General error response model."""
     
@@ -1,9 +1,23 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, PrivateAttr
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from typing import Dict, List, Optional, Tuple
+import orjson
+
+
+# Fast-path config for WhizProp payload models: no assignment validation or instance revalidation
+_MODEL_CONFIG = ConfigDict(
+    extra="ignore",
+    validate_assignment=False,
+    revalidate_instances="never",
+    populate_by_name=True
+)
 
 
 class Block(BaseModel):
     """WhizProp Block model."""
+    model_config = _MODEL_CONFIG
+    
     Id: int
     NameChi: str
     NameEng: str
@@ -12,6 +26,8 @@ class Block(BaseModel):
 
 class Floor(BaseModel):
     """WhizProp Floor model."""
+    model_config = _MODEL_CONFIG
+    
     Id: int
     BlockId: int
     NameChi: str
@@ -21,6 +37,8 @@ class Floor(BaseModel):
 
 class Flat(BaseModel):
     """WhizProp Flat model."""
+    model_config = _MODEL_CONFIG
+    
     Id: int
     FloorId: int
     NameChi: str
@@ -30,6 +48,8 @@ class Flat(BaseModel):
 
 class VisitCategory(BaseModel):
     """WhizProp Visit Category model."""
+    model_config = _MODEL_CONFIG
+    
     Id: int
     NameChi: str
     NameEng: str
@@ -38,14 +58,175 @@ class VisitCategory(BaseModel):
 
 class VisitSubCategory(BaseModel):
     """WhizProp Visit Sub Category model."""
+    model_config = _MODEL_CONFIG
+    
     VisitCatId: int
     NameChi: str
     NameEng: str
     Seq: int
 
 
+# Whitespace (including the full-width space common in Chinese input) is
+# dropped when normalizing names
+_WHITESPACE = dict.fromkeys(map(ord, " \t\n\r\f\v\u3000"))
+
+
+def normalize_name(name: str) -> str:
+    """Case-fold a name and drop all whitespace, so "Tower 1" and "tower1" compare equal."""
+    return name.casefold().translate(_WHITESPACE)
+
+
+def _ids_by_name(items, normalize=None) -> Dict[str, int]:
+    """Map each NameChi/NameEng (optionally normalized) to the ID of the first item carrying it (list order wins)."""
+    ids = {}
+    for item in items:
+        for name in (item.NameChi, item.NameEng):
+            if normalize is not None:
+                name = normalize(name)
+                if not name:
+                    continue
+            ids.setdefault(name, item.Id)
+    return ids
+
+
+def _ids_by_parent_name(items, parent_attr: str, normalize=None) -> Dict[Tuple[int, str], int]:
+    """Map each (parent ID, NameChi/NameEng) pair to the ID of the first matching item."""
+    ids = {}
+    for item in items:
+        parent_id = getattr(item, parent_attr)
+        for name in (item.NameChi, item.NameEng):
+            if normalize is not None:
+                name = normalize(name)
+                if not name:
+                    continue
+            ids.setdefault((parent_id, name), item.Id)
+    return ids
+
+
+class PartialNameMatcher:
+    """Finds the first item, in list order, whose name contains a query or is contained in it.
+    
+    Equivalent to scanning the items with
+    ``query.casefold() in name.casefold() or name in query`` for NameChi and NameEng,
+    without a Python-level loop over the items:
+    
+    - case-folded names are joined into one NUL-separated haystack, so the first
+      name containing the query is a single ``str.find``;
+    - names contained in the query are found by probing the query's substrings
+      (up to the longest name) against a name → first-position map.
+    
+    With ignore_case=True the contained-name check compares case-folded names
+    against the case-folded query too.
+    """
+    
+    def __init__(self, items, ignore_case: bool = False):
+        self._ignore_case = ignore_case
+        self._items = list(items)
+        self._starts: List[int] = []
+        chunks = []
+        offset = 0
+        self._first_position_by_name: Dict[str, int] = {}
+        self._first_position_by_seq: Dict[str, int] = {}
+        for position, item in enumerate(self._items):
+            self._first_position_by_seq.setdefault(str(item.Seq), position)
+            chunk = f"{item.NameChi.casefold()}\0{item.NameEng.casefold()}\0"
+            chunks.append(chunk)
+            self._starts.append(offset)
+            offset += len(chunk)
+            for name in (item.NameChi, item.NameEng):
+                self._first_position_by_name.setdefault(name.casefold() if ignore_case else name, position)
+        self._haystack = "".join(chunks)
+        self._max_name_len = max(map(len, self._first_position_by_name), default=0)
+    
+    def _first_containing(self, query_folded: str) -> int:
+        """Position of the first item with a name containing the case-folded query."""
+        # The query itself never spans a separator
+        if "\0" not in query_folded:
+            offset = self._haystack.find(query_folded)
+            if offset >= 0:
+                return bisect_right(self._starts, offset) - 1
+        return len(self._items)
+    
+    def match_containing(self, query: str, seq: bool = False):
+        """First item whose name contains the query (ignoring case), or None.
+        
+        With seq=True an item whose Seq equals the query also matches.
+        """
+        best = self._first_containing(query.casefold())
+        if seq:
+            best = min(best, self._first_position_by_seq.get(query, best))
+        return self._items[best] if best < len(self._items) else None
+    
+    def match(self, query: str):
+        """First matching item, or None."""
+        # A name containing the query
+        query_folded = query.casefold()
+        best = self._first_containing(query_folded)
+        
+        # A name contained in the query
+        names = self._first_position_by_name
+        if self._ignore_case:
+            query = query_folded
+        if "" in names:
+            best = min(best, names[""])
+        query_len = len(query)
+        for start in range(query_len):
+            for end in range(start + 1, min(start + self._max_name_len, query_len) + 1):
+                position = names.get(query[start:end])
+                if position is not None and position < best:
+                    best = position
+        
+        return self._items[best] if best < len(self._items) else None
+
+
+def _matchers_by_parent(items, parent_attr: str) -> Dict[int, PartialNameMatcher]:
+    """One PartialNameMatcher per parent ID, over that parent's items in list order."""
+    grouped = defaultdict(list)
+    for item in items:
+        grouped[getattr(item, parent_attr)].append(item)
+    return {parent_id: PartialNameMatcher(children) for parent_id, children in grouped.items()}
+
+
+class _IndexCache(dict):
+    """Per-instance store for BuildingData's lazy indexes.
+    
+    Any two compare equal, so built indexes never affect model equality.
+    """
+    
+    def __eq__(self, other):
+        return isinstance(other, _IndexCache)
+    
+    __hash__ = None
+
+
+class _index:
+    """Like functools.cached_property, but caches in the model's private _indexes
+    instead of the instance __dict__ (which pydantic compares and copies)."""
+    
+    def __init__(self, build):
+        self._build = build
+        self.__doc__ = build.__doc__
+    
+    def __set_name__(self, owner, name):
+        self._name = name
+    
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        # Read the private slot directly; attribute access to a private goes through
+        # BaseModel.__getattr__, which is ~40x slower than a cached_property hit
+        indexes = instance.__pydantic_private__["_indexes"]
+        try:
+            return indexes[self._name]
+        except KeyError:
+            value = indexes[self._name] = self._build(instance)
+            return value
+
+
 class BuildingData(BaseModel):
     """WhizProp Building Setting response model."""
+    model_config = ConfigDict(**_MODEL_CONFIG, ignored_types=(_index,))
+    
     PrintEntryPass: bool
     BlockList: List[Block]
     FloorList: List[Floor]
@@ -55,36 +236,206 @@ class BuildingData(BaseModel):
     AuthorizationTimeList: Optional[List] = []
     PrinterList: Optional[List] = []
     PrintRemarkList: Optional[List] = []
+    
+    # Lookup indexes, each built lazily in a single pass on first access and
+    # cached in this private store (not model fields, so never serialized)
+    _indexes: _IndexCache = PrivateAttr(default_factory=_IndexCache)
+    
+    def __copy__(self):
+        # A copy may get different lists (model_copy(update=...)), so it starts without indexes
+        copied = super().__copy__()
+        copied._indexes = _IndexCache()
+        return copied
+    
+    def __deepcopy__(self, memo=None):
+        copied = super().__deepcopy__(memo)
+        copied._indexes = _IndexCache()
+        return copied
+    
+    @_index
+    def blocks_by_id(self) -> Dict[int, Block]:
+        """Blocks keyed by block ID."""
+        return {block.Id: block for block in self.BlockList}
+    
+    @_index
+    def floors_by_id(self) -> Dict[int, Floor]:
+        """Floors keyed by floor ID."""
+        return {floor.Id: floor for floor in self.FloorList}
+    
+    @_index
+    def flats_by_id(self) -> Dict[int, Flat]:
+        """Flats keyed by flat ID."""
+        return {flat.Id: flat for flat in self.UnitList}
+    
+    @_index
+    def floors_by_block(self) -> Dict[int, List[Floor]]:
+        """Floors grouped by block ID, in FloorList order."""
+        floors_by_block = defaultdict(list)
+        for floor in self.FloorList:
+            floors_by_block[floor.BlockId].append(floor)
+        return dict(floors_by_block)
+    
+    @_index
+    def flats_by_floor(self) -> Dict[int, List[Flat]]:
+        """Flats grouped by floor ID, in UnitList order."""
+        flats_by_floor = defaultdict(list)
+        for flat in self.UnitList:
+            flats_by_floor[flat.FloorId].append(flat)
+        return dict(flats_by_floor)
+    
+    # Exact-name indexes (Chinese and English names share one map per level)
+    @_index
+    def block_id_by_name(self) -> Dict[str, int]:
+        """Block IDs keyed by exact block name."""
+        return _ids_by_name(self.BlockList)
+    
+    @_index
+    def floor_id_by_name(self) -> Dict[str, int]:
+        """Floor IDs keyed by exact floor name, across all blocks."""
+        return _ids_by_name(self.FloorList)
+    
+    @_index
+    def floor_id_by_block_name(self) -> Dict[Tuple[int, str], int]:
+        """Floor IDs keyed by (block ID, exact floor name)."""
+        return _ids_by_parent_name(self.FloorList, "BlockId")
+    
+    @_index
+    def flat_id_by_name(self) -> Dict[str, int]:
+        """Flat IDs keyed by exact flat name, across all floors."""
+        return _ids_by_name(self.UnitList)
+    
+    @_index
+    def flat_id_by_floor_name(self) -> Dict[Tuple[int, str], int]:
+        """Flat IDs keyed by (floor ID, exact flat name)."""
+        return _ids_by_parent_name(self.UnitList, "FloorId")
+    
+    # Normalized-name indexes (see normalize_name)
+    @_index
+    def block_id_by_norm_name(self) -> Dict[str, int]:
+        """Block IDs keyed by normalized block name."""
+        return _ids_by_name(self.BlockList, normalize_name)
+    
+    @_index
+    def floor_id_by_norm_name(self) -> Dict[str, int]:
+        """Floor IDs keyed by normalized floor name, across all blocks."""
+        return _ids_by_name(self.FloorList, normalize_name)
+    
+    @_index
+    def floor_id_by_block_norm_name(self) -> Dict[Tuple[int, str], int]:
+        """Floor IDs keyed by (block ID, normalized floor name)."""
+        return _ids_by_parent_name(self.FloorList, "BlockId", normalize_name)
+    
+    @_index
+    def flat_id_by_norm_name(self) -> Dict[str, int]:
+        """Flat IDs keyed by normalized flat name, across all floors."""
+        return _ids_by_name(self.UnitList, normalize_name)
+    
+    @_index
+    def flat_id_by_floor_norm_name(self) -> Dict[Tuple[int, str], int]:
+        """Flat IDs keyed by (floor ID, normalized flat name)."""
+        return _ids_by_parent_name(self.UnitList, "FloorId", normalize_name)
+    
+    @_index
+    def visit_cat_id_by_norm_name(self) -> Dict[str, int]:
+        """Visit category IDs keyed by normalized category name."""
+        return _ids_by_name(self.VisitCat or (), normalize_name)
+    
+    @_index
+    def visit_subcat_by_norm_name(self) -> Dict[str, str]:
+        """Visit sub category NameChi keyed by normalized sub category name."""
+        names = {}
+        for subcat in self.VisitSubCat or ():
+            for name in (normalize_name(subcat.NameChi), normalize_name(subcat.NameEng)):
+                if name:
+                    names.setdefault(name, subcat.NameChi)
+        return names
+    
+    # Partial-name matchers (see PartialNameMatcher)
+    @_index
+    def visit_cat_matcher(self) -> PartialNameMatcher:
+        """Case-insensitive partial visit category name matcher."""
+        return PartialNameMatcher(self.VisitCat or (), ignore_case=True)
+    
+    @_index
+    def visit_subcat_matcher(self) -> PartialNameMatcher:
+        """Case-insensitive partial visit sub category name matcher."""
+        return PartialNameMatcher(self.VisitSubCat or (), ignore_case=True)
+    
+    @_index
+    def block_matcher(self) -> PartialNameMatcher:
+        """Partial block name matcher over all blocks."""
+        return PartialNameMatcher(self.BlockList)
+    
+    @_index
+    def floor_matcher(self) -> PartialNameMatcher:
+        """Partial floor name matcher over all floors."""
+        return PartialNameMatcher(self.FloorList)
+    
+    @_index
+    def floor_matchers_by_block(self) -> Dict[int, PartialNameMatcher]:
+        """Partial floor name matchers, one per block ID."""
+        return _matchers_by_parent(self.FloorList, "BlockId")
+    
+    @_index
+    def flat_matcher(self) -> PartialNameMatcher:
+        """Partial flat name matcher over all flats."""
+        return PartialNameMatcher(self.UnitList)
+    
+    @_index
+    def flat_matchers_by_floor(self) -> Dict[int, PartialNameMatcher]:
+        """Partial flat name matchers, one per floor ID."""
+        return _matchers_by_parent(self.UnitList, "FloorId")
+    
+    def build_indexes(self) -> "BuildingData":
+        """Build every lazy index and the n8n payload now instead of on first use."""
+        for name in ("blocks_by_id", "floors_by_id", "flats_by_id", "floors_by_block", "flats_by_floor",
+                     "block_id_by_name", "floor_id_by_name", "floor_id_by_block_name",
+                     "flat_id_by_name", "flat_id_by_floor_name",
+                     "block_id_by_norm_name", "floor_id_by_norm_name", "floor_id_by_block_norm_name",
+                     "flat_id_by_norm_name", "flat_id_by_floor_norm_name",
+                     "visit_cat_id_by_norm_name", "visit_subcat_by_norm_name",
+                     "visit_cat_matcher", "visit_subcat_matcher",
+                     "block_matcher", "floor_matcher", "floor_matchers_by_block",
+                     "flat_matcher", "flat_matchers_by_floor", "n8n_payload"):
+            getattr(self, name)
+        return self
+    
+    @_index
+    def n8n_payload(self) -> bytes:
+        """The building_data section of the n8n webhook body, serialized once."""
+        return orjson.dumps({
+            "BlockList": [{"Id": b.Id, "NameChi": b.NameChi, "NameEng": b.NameEng} for b in self.BlockList],
+            "FloorList": [{"Id": f.Id, "BlockId": f.BlockId, "NameChi": f.NameChi, "NameEng": f.NameEng} for f in self.FloorList],
+            "UnitList": [{"Id": u.Id, "FloorId": u.FloorId, "NameChi": u.NameChi, "NameEng": u.NameEng} for u in self.UnitList],
+            "VisitCat": [{"Id": v.Id, "NameChi": v.NameChi, "NameEng": v.NameEng} for v in self.VisitCat] if self.VisitCat else [],
+            "VisitSubCat": [{"VisitCatId": vs.VisitCatId, "NameChi": vs.NameChi, "NameEng": vs.NameEng} for vs in self.VisitSubCat] if self.VisitSubCat else []
+        })
 
 
 class WhizPropResponse(BaseModel):
     """WhizProp API response wrapper."""
+    model_config = _MODEL_CONFIG
+    
     status: int
     errMsg: str
     data: BuildingData
 
 
-class VisitCategory(BaseModel):
-    """Visit category structure."""
-    name_chi: str
-    name_eng: str
-    has_subcategories: bool = False
-
-
-class SubCategory(BaseModel):
-    """Sub category structure."""
-    name_chi: str
-    name_eng: str
-    parent_category: str
+# Read-only category lookup tables (plain namedtuples, no pydantic validation)
+VisitCategory = namedtuple("VisitCategory", "name_chi name_eng has_subcategories")
+SubCategory = namedtuple("SubCategory", "name_chi name_eng parent_category")
 
 
-# Predefined categories
+# Predefined categories, keyed by WhizProp main category ID
 MAIN_CATEGORIES = {
-    "探訪": VisitCategory(name_chi="探訪", name_eng="Visit", has_subcategories=False),
-    "外賣": VisitCategory(name_chi="外賣", name_eng="Delivery", has_subcategories=True)
+    19: VisitCategory(name_chi="探訪", name_eng="Visit", has_subcategories=False),
+    20: VisitCategory(name_chi="外賣", name_eng="Delivery", has_subcategories=True)
 }
 
 SUB_CATEGORIES = {
     "FoodPanda": SubCategory(name_chi="熊猫", name_eng="FoodPanda", parent_category="外賣"),
     "Keeta": SubCategory(name_chi="美團", name_eng="Keeta", parent_category="外賣")
-} 
\ No newline at end of file
+}
+
+# O(1) canonicalization of sub category Chinese names
+SUB_BY_NAME_CHI = {sub.name_chi: sub for sub in SUB_CATEGORIES.values()}
@@ -1,14 +1,64 @@
+import asyncio
 import httpx
-import json
-import re
+import orjson
+import random
 from typing import Dict, Any, Optional, Tuple
 from app.config.settings import settings
-from app.models.whizprop import BuildingData
+from app.models.whizprop import BuildingData, PartialNameMatcher, normalize_name
 from app.models.responses import RawExtracted
 import logging
 
 logger = logging.getLogger(__name__)
 
+# n8n runs the model call, so reads can be slow; connecting should not be
+N8N_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# Startup warmup is best effort and must not hold up the lifespan for long
+N8N_WARMUP_TIMEOUT = httpx.Timeout(3.0)
+
+# Retry policy for n8n rate limiting (HTTP 429): exponential backoff with jitter
+N8N_MAX_ATTEMPTS = 3
+N8N_BACKOFF_BASE = 0.5
+N8N_BACKOFF_CAP = 8.0
+
+# The webhook body is pre-encoded bytes, so the content type is set explicitly
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Fields every extraction result must carry
+_REQUIRED_FIELDS = frozenset(('visitor_name', 'block_id', 'floor_id', 'flat_id', 'id_card_prefix', 'main_category'))
+
+# Apartment fields the model may fill with placeholder strings instead of null
+_APARTMENT_FIELDS = ('block_id', 'floor_id', 'flat_id')
+_NULLISH = frozenset(('none', 'null', ''))
+
+# Keyword → category ID / sub category NameChi, checked in order as substrings
+# of the lowercased model output (keys are stored pre-lowered)
+_CATEGORY_MAPPINGS = (
+    ("探訪", 19),
+    ("visit", 19),
+    ("visiting", 19),
+    ("外賣", 20),
+    ("delivery", 20),
+    ("送外賣", 20),
+    ("food delivery", 20)
+)
+
+_SUBCATEGORY_MAPPINGS = (
+    ("foodpanda", "熊貓"),
+    ("熊猫", "熊貓"),
+    ("熊貓", "熊貓"),
+    ("panda", "熊貓"),
+    ("keeta", "美團"),
+    ("美團", "美團"),
+    ("meituan", "美團"),
+    ("美团", "美團")
+)
+
+
+def _clamp(value: float, low: float, high: float) -> float:
+    """Clamp value to [low, high] (NaN clamps to low)."""
+    return low if not value >= low else high if value > high else value
+
 
 class GeminiServiceError(Exception):
     """Gemini service specific exception."""
@@ -18,347 +68,287 @@ class GeminiServiceError(Exception):
 class GeminiService:
     """Service for AI text processing using n8n webhook that calls Gemini via VPN."""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         # n8n webhook configuration
         self.n8n_webhook_url = "https://propman.necess.com.hk/webhook/7c694ca5-5e9c-4711-ad30-d4f06648be18"
         
-        logger.info(f"Initializing GeminiService with n8n webhook: {self.n8n_webhook_url}")
-
-    async def _make_n8n_request(self, prompt: str, building_data: BuildingData) -> str:
-        """Make a request to n8n webhook which calls Gemini via VPN."""
+        # Shared HTTP client (injected by the app lifespan, created lazily otherwise)
+        self._http_client: Optional[httpx.AsyncClient] = http_client
+        self._owns_http_client = False
         
-        headers = {
-            "Content-Type": "application/json"
-        }
+        # Bounds in-flight webhook calls so bursts queue here instead of overloading n8n
+        self._semaphore = asyncio.Semaphore(max(1, settings.max_concurrent_gemini))
         
-        # Prepare payload for n8n webhook
-        payload = {
-            "text_input": prompt,
-            "building_data": {
-                "BlockList": [{"Id": b.Id, "NameChi": b.NameChi, "NameEng": b.NameEng} for b in building_data.BlockList],
-                "FloorList": [{"Id": f.Id, "BlockId": f.BlockId, "NameChi": f.NameChi, "NameEng": f.NameEng} for f in building_data.FloorList],
-                "UnitList": [{"Id": u.Id, "FloorId": u.FloorId, "NameChi": u.NameChi, "NameEng": u.NameEng} for u in building_data.UnitList],
-                "VisitCat": [{"Id": v.Id, "NameChi": v.NameChi, "NameEng": v.NameEng} for v in building_data.VisitCat] if building_data.VisitCat else [],
-                "VisitSubCat": [{"VisitCatId": vs.VisitCatId, "NameChi": vs.NameChi, "NameEng": vs.NameEng} for vs in building_data.VisitSubCat] if building_data.VisitSubCat else []
-            }
-        }
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
+        logger.info("Initializing GeminiService with n8n webhook: %s", self.n8n_webhook_url)
+
+    def use_http_client(self, client: httpx.AsyncClient):
+        """Use a shared, externally managed HTTP client for webhook calls."""
+        self._http_client = client
+        self._owns_http_client = False
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Get the pooled HTTP client, creating one on first use if none was injected."""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(http2=True, timeout=N8N_TIMEOUT)
+            self._owns_http_client = True
+        return self._http_client
+
+    async def warmup(self):
+        """Open a pooled connection to the webhook (DNS, TCP and TLS) ahead of the first request."""
+        try:
+            await self._get_http_client().head(self.n8n_webhook_url, timeout=N8N_WARMUP_TIMEOUT)
+        except httpx.HTTPError as e:
+            logger.warning("n8n webhook warmup failed: %s", e)
+
+    async def aclose(self):
+        """Close the HTTP client if this service created it."""
+        if self._owns_http_client and self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+        self._owns_http_client = False
+
+    @staticmethod
+    def _retry_delay(response: httpx.Response, attempt: int) -> float:
+        """Backoff before retrying a 429, honoring a numeric Retry-After header."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
             try:
-                logger.info(f"Sending request to n8n webhook...")
-                response = await client.post(self.n8n_webhook_url, headers=headers, json=payload)
-                response.raise_for_status()
+                return min(max(float(retry_after), 0.0), N8N_BACKOFF_CAP)
+            except ValueError:
+                pass  # HTTP-date form; fall back to exponential backoff
+        return min(N8N_BACKOFF_BASE * 2 ** attempt, N8N_BACKOFF_CAP) * random.uniform(0.75, 1.25)
+
+    async def _make_n8n_request(self, prompt: str, building_data: BuildingData) -> Dict[str, Any]:
+        """Make a request to n8n webhook which calls Gemini via VPN, returning the extracted fields."""
+        
+        # Prepare payload for n8n webhook; the building_data section is
+        # invariant per building, so only the prompt is encoded per call
+        content = b'{"text_input":' + orjson.dumps(prompt) + b',"building_data":' + building_data.n8n_payload + b'}'
+        
+        client = self._get_http_client()
+        try:
+            logger.info("Sending request to n8n webhook...")
+            async with self._semaphore:
+                for attempt in range(N8N_MAX_ATTEMPTS):
+                    response = await client.post(self.n8n_webhook_url, headers=_JSON_HEADERS, content=content, timeout=N8N_TIMEOUT)
+                    if response.status_code != 429 or attempt == N8N_MAX_ATTEMPTS - 1:
+                        break
+                    delay = self._retry_delay(response, attempt)
+                    logger.warning("n8n webhook rate limited, retrying in %.2fs (attempt %d/%d)", delay, attempt + 1, N8N_MAX_ATTEMPTS)
+                    await asyncio.sleep(delay)
+            response.raise_for_status()
+            
+            result = orjson.loads(response.content)
+            logger.debug("n8n webhook raw response: %s", result)
+            
+            # Check if n8n response indicates success
+            if result.get('status') == 'success':
+                # Extract the parsed data from n8n response
+                data = result.get('data', {})
                 
-                result = response.json()
-                logger.info(f"n8n webhook raw response: {result}")
+                # Normalize the n8n response to the Gemini extraction fields
+                gemini_format = {
+                    "visitor_name": data.get('visitor_name'),
+                    "block_id": data.get('block_id'),
+                    "floor_id": data.get('floor_id'), 
+                    "flat_id": data.get('flat_id'),
+                    "id_card_prefix": data.get('id_card_prefix'),
+                    "main_category": data.get('main_category'),
+                    "sub_category": data.get('sub_category'),
+                    "confidence": data.get('confidence', 0.8)
+                }
                 
-                # Check if n8n response indicates success
-                if result.get('status') == 'success':
-                    # Extract the parsed data from n8n response
-                    data = result.get('data', {})
-                    
-                    # Convert n8n response back to Gemini-like JSON format for compatibility
-                    gemini_format = {
-                        "visitor_name": data.get('visitor_name'),
-                        "block_id": data.get('block_id'),
-                        "floor_id": data.get('floor_id'), 
-                        "flat_id": data.get('flat_id'),
-                        "id_card_prefix": data.get('id_card_prefix'),
-                        "main_category": data.get('main_category'),
-                        "sub_category": data.get('sub_category'),
-                        "confidence": data.get('confidence', 0.8)
-                    }
-                    
-                    # Return as JSON string to match original _make_request behavior
-                    return json.dumps(gemini_format)
-                    
-                elif result.get('status') == 'error':
-                    error_msg = result.get('message', 'Unknown error from n8n')
-                    logger.error(f"n8n webhook returned error: {error_msg}")
-                    raise GeminiServiceError(f"n8n processing failed: {error_msg}")
-                else:
-                    logger.error(f"Invalid n8n response structure: {result}")
-                    raise GeminiServiceError("Invalid response from n8n webhook")
+                return gemini_format
                 
-            except httpx.HTTPStatusError as e:
-                logger.error(f"n8n webhook HTTP error: {e.response.status_code} - {e.response.text}")
-                raise GeminiServiceError(f"n8n webhook request failed: {e.response.status_code}")
-            except httpx.RequestError as e:
-                logger.error(f"n8n webhook request error: {str(e)}")
-                raise GeminiServiceError(f"n8n webhook connection failed: {str(e)}")
-            except Exception as e:
-                logger.error(f"n8n webhook unexpected error: {str(e)}")
-                raise GeminiServiceError(f"n8n webhook unexpected error: {str(e)}")
-
-    def _validate_and_convert_id(self, extracted_value: Any, item_list: list, item_type: str) -> Optional[int]:
-        """
-        Validate and convert name/ID to actual ID.
-        """
-        logger.info(f"Validating {item_type}: extracted_value='{extracted_value}', type={type(extracted_value)}")
-        
-        if not extracted_value:
-            logger.info(f"No {item_type} value to validate")
-            return None
-            
-        # If it's already a number and exists in the list, return it
+            elif result.get('status') == 'error':
+                error_msg = result.get('message', 'Unknown error from n8n')
+                logger.error("n8n webhook returned error: %s", error_msg)
+                raise GeminiServiceError(f"n8n processing failed: {error_msg}")
+            else:
+                logger.error("Invalid n8n response structure: %s", result)
+                raise GeminiServiceError("Invalid response from n8n webhook")
+            
+        except httpx.HTTPStatusError as e:
+            logger.error("n8n webhook HTTP error: %s - %s", e.response.status_code, e.response.text)
+            raise GeminiServiceError(f"n8n webhook request failed: {e.response.status_code}")
+        except httpx.RequestError as e:
+            logger.error("n8n webhook request error: %s", e)
+            raise GeminiServiceError(f"n8n webhook connection failed: {str(e)}")
+        except Exception as e:
+            logger.error("n8n webhook unexpected error: %s", e)
+            raise GeminiServiceError(f"n8n webhook unexpected error: {str(e)}")
+
+    @staticmethod
+    def _as_id(extracted_value: Any) -> Optional[int]:
+        """Numeric value or all-digit string as an int ID, otherwise None."""
         if isinstance(extracted_value, (int, float)):
-            extracted_id = int(extracted_value)
-            if any(item.Id == extracted_id for item in item_list):
-                return extracted_id
-        
-        # If it's a string that looks like a number
+            return int(extracted_value)
         if isinstance(extracted_value, str) and extracted_value.isdigit():
-            extracted_id = int(extracted_value)
-            if any(item.Id == extracted_id for item in item_list):
-                return extracted_id
-        
-        # Try to match by name (Chinese or English)
-        if isinstance(extracted_value, str):
-            extracted_lower = extracted_value.lower()
-            
-            # First try exact match (most reliable)
-            for item in item_list:
-                if (extracted_value == item.NameChi or 
-                    extracted_value == item.NameEng):
-                    logger.info(f"Found exact {item_type} match: {extracted_value} → {item.NameChi} (ID: {item.Id})")
-                    return item.Id
-            
-            # Then try partial matching
-            for item in item_list:
-                item_name_chi = str(item.NameChi).lower() if item.NameChi else ""
-                item_name_eng = str(item.NameEng).lower() if item.NameEng else ""
-                
-                if (extracted_lower in item_name_chi or 
-                    extracted_lower in item_name_eng or
-                    item.NameChi in extracted_value or 
-                    item.NameEng in extracted_value):
-                    logger.info(f"Found partial {item_type} match: {extracted_value} → {item.NameChi} (ID: {item.Id})")
-                    return item.Id
-        
-        # If no match found, return None (don't guess!)
-        logger.warning(f"Could not find {item_type} for '{extracted_value}' in available options")
+            return int(extracted_value)
         return None
 
-    def _validate_and_convert_floor_id(self, extracted_value: Any, floor_list: list, block_id: Optional[int]) -> Optional[int]:
+    def _lookup_id(
+        self,
+        extracted_value: Any,
+        item_type: str,
+        items_by_id: Dict[int, Any],
+        ids_by_name: Dict[str, int],
+        ids_by_norm_name: Dict[str, int],
+        matcher: PartialNameMatcher,
+        parent_id: Optional[int] = None,
+        parent_attr: Optional[str] = None,
+        ids_by_parent_name: Optional[Dict[Tuple[int, str], int]] = None,
+        ids_by_parent_norm_name: Optional[Dict[Tuple[int, str], int]] = None,
+        matchers_by_parent: Optional[Dict[int, PartialNameMatcher]] = None,
+        strict_parent: bool = False
+    ) -> Optional[int]:
         """
-        Validate and convert floor name/ID to actual floor ID, considering the block.
+        Validate and convert an extracted name/ID to an actual ID.
+        
+        Matching order: ID, then exact, normalized and partial name under the
+        parent (if any), then exact, normalized and partial name anywhere. With strict_parent, an ID under a
+        different parent is rejected outright and nothing outside the parent is searched.
         """
+        logger.debug("Validating %s: extracted_value='%s', type=%s", item_type, extracted_value, type(extracted_value))
+        
         if not extracted_value:
+            logger.debug("No %s value to validate", item_type)
             return None
-            
-        # If it's already a number and exists in the list, return it
-        if isinstance(extracted_value, (int, float)):
-            extracted_id = int(extracted_value)
-            if any(floor.Id == extracted_id for floor in floor_list):
-                return extracted_id
         
-        # If it's a string that looks like a number
-        if isinstance(extracted_value, str) and extracted_value.isdigit():
-            extracted_id = int(extracted_value)
-            if any(floor.Id == extracted_id for floor in floor_list):
-                return extracted_id
+        # If it's a number (or a string that looks like one) and exists in the list, return it
+        extracted_id = self._as_id(extracted_value)
+        item = items_by_id.get(extracted_id)
+        if item is not None:
+            item_parent_id = getattr(item, parent_attr) if parent_attr else None
+            if strict_parent and parent_id and item_parent_id != parent_id:
+                # A real ID under another parent; name matching could map e.g. "6002" onto floor "2"
+                logger.warning("%s ID %s exists but is under %s %s, not the expected %s", item_type, extracted_id, parent_attr, item_parent_id, parent_id)
+                return None
+            return extracted_id
         
-        # Try to match by name, preferring floors in the same block
         if isinstance(extracted_value, str):
-            extracted_lower = extracted_value.lower()
-            
-            # First try to find in the same block
-            if block_id:
-                # Try exact match first in the same block
-                for floor in floor_list:
-                    if (floor.BlockId == block_id and 
-                        (extracted_value == floor.NameChi or extracted_value == floor.NameEng)):
-                        logger.info(f"Found exact floor match in block {block_id}: {extracted_value} → {floor.NameChi} (ID: {floor.Id})")
-                        return floor.Id
+            norm_value = normalize_name(extracted_value)
+            
+            # First try to find under the same parent (exact match first, then partial)
+            if parent_id and parent_attr:
+                item_id = ids_by_parent_name.get((parent_id, extracted_value))
+                if item_id is not None:
+                    logger.debug("Found exact %s match under %s %s: %s → %s (ID: %s)", item_type, parent_attr, parent_id, extracted_value, items_by_id[item_id].NameChi, item_id)
+                    return item_id
                 
-                # Then try partial match in the same block
-                for floor in floor_list:
-                    if floor.BlockId == block_id:
-                        floor_name_chi = str(floor.NameChi).lower() if floor.NameChi else ""
-                        floor_name_eng = str(floor.NameEng).lower() if floor.NameEng else ""
-                        
-                        if (extracted_lower in floor_name_chi or 
-                            extracted_lower in floor_name_eng or
-                            floor.NameChi in extracted_value or 
-                            floor.NameEng in extracted_value):
-                            logger.info(f"Found partial floor match in block {block_id}: {extracted_value} → {floor.NameChi} (ID: {floor.Id})")
-                            return floor.Id
-            
-            # Then try to find anywhere (exact match first, then partial)
-            # Try exact match in any floor
-            for floor in floor_list:
-                if extracted_value == floor.NameChi or extracted_value == floor.NameEng:
-                    logger.info(f"Found exact floor match anywhere: {extracted_value} → {floor.NameChi} (ID: {floor.Id})")
-                    return floor.Id
-            
-            # Try partial match in any floor
-            for floor in floor_list:
-                floor_name_chi = str(floor.NameChi).lower() if floor.NameChi else ""
-                floor_name_eng = str(floor.NameEng).lower() if floor.NameEng else ""
+                item_id = ids_by_parent_norm_name.get((parent_id, norm_value))
+                if item_id is not None:
+                    logger.debug("Found normalized %s match under %s %s: %s → %s (ID: %s)", item_type, parent_attr, parent_id, extracted_value, items_by_id[item_id].NameChi, item_id)
+                    return item_id
                 
-                if (extracted_lower in floor_name_chi or 
-                    extracted_lower in floor_name_eng or
-                    floor.NameChi in extracted_value or 
-                    floor.NameEng in extracted_value):
-                    logger.info(f"Found partial floor match anywhere: {extracted_value} → {floor.NameChi} (ID: {floor.Id})")
-                    return floor.Id
-        
-        # If no match found, return None (don't guess!)
-        logger.warning(f"Could not find floor '{extracted_value}' in the specified block {block_id}")
-        return None
-
-    def _validate_and_convert_flat_id(self, extracted_value: Any, unit_list: list, floor_id: Optional[int]) -> Optional[int]:
-        """
-        Validate and convert flat name/ID to actual flat ID, considering the floor.
-        """
-        if not extracted_value:
-            return None
-            
-        # If it's already a number and exists in the list, check if it's on the correct floor
-        if isinstance(extracted_value, (int, float)):
-            extracted_id = int(extracted_value)
-            for unit in unit_list:
-                if unit.Id == extracted_id:
-                    # If we have a floor constraint, make sure the unit is on that floor
-                    if floor_id and unit.FloorId != floor_id:
-                        logger.warning(f"Unit ID {extracted_id} exists but is on floor {unit.FloorId}, not the expected floor {floor_id}")
-                        break  # Don't return this unit, continue with name matching
-                    return extracted_id
-        
-        # If it's a string that looks like a number
-        if isinstance(extracted_value, str) and extracted_value.isdigit():
-            extracted_id = int(extracted_value)
-            for unit in unit_list:
-                if unit.Id == extracted_id:
-                    # If we have a floor constraint, make sure the unit is on that floor
-                    if floor_id and unit.FloorId != floor_id:
-                        logger.warning(f"Unit ID {extracted_id} exists but is on floor {unit.FloorId}, not the expected floor {floor_id}")
-                        break  # Don't return this unit, continue with name matching
-                    return extracted_id
-        
-        # Try to match by name, preferring units on the same floor
-        if isinstance(extracted_value, str):
-            extracted_lower = extracted_value.lower()
-            
-            # First try to find on the same floor
-            if floor_id:
-                # Debug: show available units on this floor
-                units_on_floor = [unit for unit in unit_list if unit.FloorId == floor_id]
-                logger.info(f"Units available on floor {floor_id}: {[(unit.NameChi, unit.Id) for unit in units_on_floor]}")
-                # Try exact match first on the same floor
-                for unit in unit_list:
-                    if (unit.FloorId == floor_id and 
-                        (extracted_value == unit.NameChi or extracted_value == unit.NameEng)):
-                        logger.info(f"Found exact unit match on floor {floor_id}: {extracted_value} → {unit.NameChi} (ID: {unit.Id})")
-                        return unit.Id
-                
-                # Then try partial match on the same floor
-                for unit in unit_list:
-                    if unit.FloorId == floor_id:
-                        unit_name_chi = str(unit.NameChi).lower() if unit.NameChi else ""
-                        unit_name_eng = str(unit.NameEng).lower() if unit.NameEng else ""
-                        
-                        if (extracted_lower in unit_name_chi or 
-                            extracted_lower in unit_name_eng or
-                            unit.NameChi in extracted_value or 
-                            unit.NameEng in extracted_value):
-                            logger.info(f"Found partial unit match on floor {floor_id}: {extracted_value} → {unit.NameChi} (ID: {unit.Id})")
-                            return unit.Id
-            
-            # If we have a valid floor_id, DON'T look for units on other floors
-            # This prevents incorrect mapping like finding "B室" on floor 2 when we need "B室" on floor 4
-            if floor_id:
-                logger.warning(f"Could not find unit '{extracted_value}' on the specified floor {floor_id}. Not searching other floors to avoid incorrect mapping.")
-                # Return None to force fallback behavior in calling function
-                return None
-            
-            # Only search anywhere if we don't have a specific floor constraint
-            # Try exact match in any unit (only if no floor_id constraint)
-            for unit in unit_list:
-                if extracted_value == unit.NameChi or extracted_value == unit.NameEng:
-                    logger.info(f"Found exact unit match anywhere (no floor constraint): {extracted_value} → {unit.NameChi} (ID: {unit.Id}, FloorId: {unit.FloorId})")
-                    return unit.Id
-            
-            # Try partial match in any unit (only if no floor_id constraint)
-            for unit in unit_list:
-                unit_name_chi = str(unit.NameChi).lower() if unit.NameChi else ""
-                unit_name_eng = str(unit.NameEng).lower() if unit.NameEng else ""
+                parent_matcher = matchers_by_parent.get(parent_id)
+                item = parent_matcher.match(extracted_value) if parent_matcher else None
+                if item is not None:
+                    logger.debug("Found partial %s match under %s %s: %s → %s (ID: %s)", item_type, parent_attr, parent_id, extracted_value, item.NameChi, item.Id)
+                    return item.Id
                 
-                if (extracted_lower in unit_name_chi or 
-                    extracted_lower in unit_name_eng or
-                    unit.NameChi in extracted_value or 
-                    unit.NameEng in extracted_value):
-                    logger.info(f"Found partial unit match anywhere (no floor constraint): {extracted_value} → {unit.NameChi} (ID: {unit.Id}, FloorId: {unit.FloorId})")
-                    return unit.Id
+                if strict_parent:
+                    # e.g. don't map "B室" on floor 2 when "B室" on floor 4 was asked for
+                    logger.warning("Could not find %s '%s' under %s %s. Not searching elsewhere to avoid incorrect mapping.", item_type, extracted_value, parent_attr, parent_id)
+                    return None
+            
+            # Then try anywhere (exact match first, then partial)
+            item_id = ids_by_name.get(extracted_value)
+            if item_id is not None:
+                logger.debug("Found exact %s match: %s → %s (ID: %s)", item_type, extracted_value, items_by_id[item_id].NameChi, item_id)
+                return item_id
+            
+            item_id = ids_by_norm_name.get(norm_value)
+            if item_id is not None:
+                logger.debug("Found normalized %s match: %s → %s (ID: %s)", item_type, extracted_value, items_by_id[item_id].NameChi, item_id)
+                return item_id
+            
+            item = matcher.match(extracted_value)
+            if item is not None:
+                logger.debug("Found partial %s match: %s → %s (ID: %s)", item_type, extracted_value, item.NameChi, item.Id)
+                return item.Id
         
         # If no match found, return None (don't guess!)
-        logger.warning(f"Could not find unit '{extracted_value}' on the specified floor {floor_id}")
+        logger.warning("Could not find %s for '%s' in available options", item_type, extracted_value)
         return None
 
-    def _convert_category_name_to_id(self, category_name: str, visit_categories: list) -> Optional[int]:
+    def _validate_and_convert_block_id(self, extracted_value: Any, building_data: BuildingData) -> Optional[int]:
+        """Validate and convert block name/ID to actual block ID."""
+        return self._lookup_id(
+            extracted_value, "block", building_data.blocks_by_id, building_data.block_id_by_name,
+            building_data.block_id_by_norm_name, building_data.block_matcher
+        )
+
+    def _validate_and_convert_floor_id(self, extracted_value: Any, building_data: BuildingData, block_id: Optional[int]) -> Optional[int]:
+        """Validate and convert floor name/ID to actual floor ID, only in the block when one is given."""
+        return self._lookup_id(
+            extracted_value, "floor", building_data.floors_by_id, building_data.floor_id_by_name,
+            building_data.floor_id_by_norm_name, building_data.floor_matcher,
+            block_id, "BlockId", building_data.floor_id_by_block_name,
+            building_data.floor_id_by_block_norm_name, building_data.floor_matchers_by_block,
+            strict_parent=True
+        )
+
+    def _validate_and_convert_flat_id(self, extracted_value: Any, building_data: BuildingData, floor_id: Optional[int]) -> Optional[int]:
+        """Validate and convert flat name/ID to actual flat ID, only on the floor when one is given."""
+        return self._lookup_id(
+            extracted_value, "unit", building_data.flats_by_id, building_data.flat_id_by_name,
+            building_data.flat_id_by_norm_name, building_data.flat_matcher,
+            floor_id, "FloorId", building_data.flat_id_by_floor_name,
+            building_data.flat_id_by_floor_norm_name, building_data.flat_matchers_by_floor,
+            strict_parent=True
+        )
+
+    def _convert_category_name_to_id(self, category_name: str, building_data: BuildingData) -> Optional[int]:
         """Convert category name to ID."""
-        if not category_name or not visit_categories:
+        if not category_name or not building_data.VisitCat:
             return None
             
         # Convert to string if it's not already
         category_name = str(category_name)
             
-        # Common mappings
-        category_mappings = {
-            "探訪": 19,
-            "visit": 19,
-            "visiting": 19,
-            "外賣": 20,
-            "delivery": 20,
-            "送外賣": 20,
-            "food delivery": 20
-        }
-        
         # Check direct mapping first
-        for key, cat_id in category_mappings.items():
-            if key.lower() in category_name.lower():
+        name_lower = category_name.lower()
+        for key, cat_id in _CATEGORY_MAPPINGS:
+            if key in name_lower:
                 return cat_id
         
-        # Try to match with actual category list
-        for category in visit_categories:
-            if (category.NameChi in category_name or 
-                category.NameEng.lower() in category_name.lower() or
-                category_name in category.NameChi or
-                category_name.lower() in category.NameEng.lower()):
-                return category.Id
+        # Then an exact (normalized) category name
+        cat_id = building_data.visit_cat_id_by_norm_name.get(normalize_name(category_name))
+        if cat_id is not None:
+            return cat_id
         
-        # Default fallback
-        return None  # Default to delivery
+        # Try a partial match against the actual category list
+        category = building_data.visit_cat_matcher.match(category_name)
+        return category.Id if category is not None else None
 
-    def _get_validation_suggestions(self, extracted_value: str, item_list: list, item_type: str, parent_constraint: Optional[int] = None) -> list:
-        """Get suggestions for invalid apartment components."""
+    def _get_validation_suggestions(self, extracted_value: str, item_list) -> list:
+        """Get suggestions for invalid apartment components.
+        
+        Callers pass only the candidates under the parent constraint (e.g. the
+        floors of the selected block), taken from the BuildingData indexes.
+        """
         suggestions = []
         
-        if not extracted_value or not item_list:
+        if not extracted_value or len(extracted_value) <= 1 or not item_list:
             return suggestions
         
         # Find similar names (fuzzy matching)
-        extracted_lower = extracted_value.lower()
-        
+        prefix = extracted_value[:-1]
+        value_len = len(extracted_value)
         for item in item_list:
-            # Skip items that don't match parent constraint (e.g., floors not in the specified block)
-            if item_type == "floor" and parent_constraint and hasattr(item, 'BlockId') and item.BlockId != parent_constraint:
-                continue
-            if item_type == "unit" and parent_constraint and hasattr(item, 'FloorId') and item.FloorId != parent_constraint:
-                continue
-                
-            item_name = str(item.NameChi) if item.NameChi else ""
+            item_name = item.NameChi
             
             # Check for similar patterns
-            if (len(extracted_value) > 1 and len(item_name) > 1 and 
-                (extracted_value[:-1] in item_name or item_name[:-1] in extracted_value or
-                 abs(len(extracted_value) - len(item_name)) <= 1)):
+            if (len(item_name) > 1 and 
+                (prefix in item_name or item_name[:-1] in extracted_value or
+                 abs(value_len - len(item_name)) <= 1)):
                 suggestions.append(item_name)
         
         # Remove duplicates and limit to 5 suggestions
         return list(set(suggestions))[:5]
 
-    def _convert_subcategory_to_namechi(self, subcategory: Optional[str], visit_subcategories: list) -> Optional[str]:
+    def _convert_subcategory_to_namechi(self, subcategory: Optional[str], building_data: BuildingData) -> Optional[str]:
         """Convert subcategory to NameChi string."""
         if not subcategory:
             return ""
@@ -366,285 +356,182 @@ class GeminiService:
         # Convert to string if it's not already
         subcategory = str(subcategory)
             
-        # Common mappings for delivery services
-        subcategory_mappings = {
-            "foodpanda": "熊貓",
-            "熊猫": "熊貓",
-            "熊貓": "熊貓",
-            "panda": "熊貓",
-            "keeta": "美團",
-            "美團": "美團",
-            "meituan": "美團",
-            "美团": "美團"
-        }
-        
         # Check direct mapping first
-        for key, mapped_name in subcategory_mappings.items():
-            if key.lower() in subcategory.lower():
+        subcategory_lower = subcategory.lower()
+        for key, mapped_name in _SUBCATEGORY_MAPPINGS:
+            if key in subcategory_lower:
                 return mapped_name
         
-        # Try to match with actual subcategory list (strict validation)
-        if visit_subcategories:
-            for subcat in visit_subcategories:
-                if (subcat.NameChi in subcategory or 
-                    subcat.NameEng.lower() in subcategory.lower() or
-                    subcategory in subcat.NameChi or
-                    subcategory.lower() in subcat.NameEng.lower()):
-                    return subcat.NameChi
+        # Then an exact (normalized) subcategory name
+        name_chi = building_data.visit_subcat_by_norm_name.get(normalize_name(subcategory))
+        if name_chi is not None:
+            return name_chi
+        
+        # Try a partial match against the actual subcategory list (strict validation)
+        subcat = building_data.visit_subcat_matcher.match(subcategory)
+        if subcat is not None:
+            return subcat.NameChi
         
         # Return None if no valid mapping found (don't make up subcategories!)
-        logger.warning(f"Invalid subcategory '{subcategory}' not found in valid list, returning None")
+        logger.warning("Invalid subcategory '%s' not found in valid list, returning None", subcategory)
         return ""
 
     def _create_visitor_prompt(self, text: str, building_data: BuildingData) -> str:
-        """Create a detailed prompt for visitor information extraction with building context."""
-        
-        # Create building context
-        building_context = f"Building has {len(building_data.BlockList)} blocks, {len(building_data.FloorList)} floors, {len(building_data.UnitList)} units."
-        
-        # Create COMPLETE building data in efficient format
-        building_mappings = []
-        
-        # COMPLETE BLOCK MAPPING - All blocks
-        building_mappings.append("=== COMPLETE BLOCK MAPPING ===")
-        for block in building_data.BlockList:
-            building_mappings.append(f"'{block.NameChi}' → {block.Id}")
-        
-        # COMPLETE FLOOR MAPPING - Organized by block for efficiency  
-        building_mappings.append("\n=== COMPLETE FLOOR MAPPING ===")
-        for block in building_data.BlockList:
-            block_floors = [f for f in building_data.FloorList if f.BlockId == block.Id]
-            if block_floors:
-                building_mappings.append(f"Block {block.Id} ({block.NameChi}) floors:")
-                for floor in block_floors:
-                    building_mappings.append(f"  '{floor.NameChi}' → {floor.Id}")
-        
-        # COMPLETE UNIT MAPPING - Organized by floor for efficiency
-        building_mappings.append("\n=== COMPLETE UNIT MAPPING ===")
-        # Group units by floor to make it more readable and efficient
-        floor_units = {}
-        for unit in building_data.UnitList:
-            if unit.FloorId not in floor_units:
-                floor_units[unit.FloorId] = []
-            floor_units[unit.FloorId].append(unit)
-        
-        # Show units organized by floor
-        for floor_id, units in sorted(floor_units.items()):
-            # Find the floor name for context
-            floor_info = next((f for f in building_data.FloorList if f.Id == floor_id), None)
-            if floor_info:
-                building_mappings.append(f"Floor {floor_id} ({floor_info.NameChi} in Block {floor_info.BlockId}) units:")
-                for unit in sorted(units, key=lambda u: u.Seq):  # Sort by sequence for readability
-                    building_mappings.append(f"  '{unit.NameChi}' → {unit.Id}")
-        
-        # Categories with subcategories
-        categories_text = [
-            "探訪 (Visit) → main_category: 19",
-            "外賣 (Delivery) → main_category: 20"
-        ]
-        
-        # Add subcategories information
-        if building_data.VisitSubCat:
-            categories_text.append("\nVALID SUBCATEGORIES:")
-            for subcat in building_data.VisitSubCat:
-                categories_text.append(f"  For main_category {subcat.VisitCatId}: '{subcat.NameChi}' or '{subcat.NameEng}'")
-            categories_text.append("IMPORTANT: sub_category must be EXACTLY one of the NameChi values above, or null if none match")
-
-        prompt = f"""{text}"""
-        
-        return prompt
-
-    async def extract_visitor_info(self, text: str, building_data: BuildingData) -> Tuple[Optional[RawExtracted], float]:
-        """Extract visitor information from text using building context via n8n webhook."""
+        """Create the prompt for visitor information extraction.
+        
+        The building context (blocks, floors, units, categories) is sent to n8n
+        as structured building_data alongside the prompt, so the prompt itself
+        is just the input text.
+        """
+        return text
+
+    async def extract_visitor_info(self, text: str, building_data: BuildingData, suggest: bool = True) -> Tuple[Optional[RawExtracted], float]:
+        """Extract visitor information from text using building context via n8n webhook.
+        
+        suggest=False skips computing name suggestions for validation errors.
+        """
         try:
-            prompt = self._create_visitor_prompt(text, building_data)
-            
-            # Get response from n8n webhook (which calls Gemini via VPN)
-            response_text = await self._make_n8n_request(prompt, building_data)
-            logger.info(f"n8n response: '{response_text}'")
-            logger.info(f"Response length: {len(response_text) if response_text else 0} characters")
-            
-            # Check if response is empty
-            if not response_text or not response_text.strip():
-                logger.error(f"Empty response from n8n webhook")
-                raise GeminiServiceError("Empty response from n8n webhook")
-            
-            # Try to extract JSON from response - be more flexible for different models
-            response_text = response_text.strip()
-            
-            # First try to parse the entire response as JSON
-            try:
-                parsed_data = json.loads(response_text)
-                logger.info(f"Successfully parsed entire response as JSON: {parsed_data}")
-            except json.JSONDecodeError:
-                # If that fails, try to extract JSON using regex
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if not json_match:
-                    # If no JSON found, log the full response for debugging
-                    logger.error(f"No JSON found in response. Full response: '{response_text}'")
-                    logger.error(f"Response length: {len(response_text)} characters")
-                    logger.error(f"Response type: {type(response_text)}")
-                    
-                    # Try to find if there's any structured data
-                    if "visitor_name" in response_text.lower() or "block_id" in response_text.lower():
-                        logger.info("Response contains visitor data but not in JSON format - trying to extract manually")
-                        # For now, raise error with more context
-                        raise GeminiServiceError(f"Response not in JSON format. Got: '{response_text[:200]}...'")
-                    else:
-                        raise GeminiServiceError(f"No structured data found in response: '{response_text[:200]}...'")
-                
-                json_text = json_match.group()
-                logger.info(f"Extracted JSON: '{json_text}'")
-                
-                try:
-                    parsed_data = json.loads(json_text)
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON parsing error: {str(e)}")
-                    logger.error(f"Invalid JSON: {json_text}")
-                    raise GeminiServiceError(f"Invalid JSON format: {str(e)}")
-            
-            # Validate required fields
-            required_fields = ['visitor_name', 'block_id', 'floor_id', 'flat_id', 'id_card_prefix', 'main_category']
-            for field in required_fields:
-                if field not in parsed_data:
-                    raise GeminiServiceError(f"Missing required field: {field}")
-            
-            # Extract confidence (default to 0.8 if not provided)
-            confidence = float(parsed_data.get('confidence', 0.8))
-            confidence = max(0.0, min(1.0, confidence))  # Clamp between 0 and 1
-            
-            # Clean up "None" strings that AI might return when it can't identify data
-            for field in ['block_id', 'floor_id', 'flat_id']:
-                if str(parsed_data.get(field, '')).lower() in ['none', 'null', '']:
-                    parsed_data[field] = None
-            
-            # Validate and convert IDs - collect validation errors instead of guessing  
-            logger.info(f"Raw extracted values - block: {parsed_data.get('block_id')}, floor: {parsed_data.get('floor_id')}, flat: {parsed_data.get('flat_id')}")
-            
-            validation_errors = []
-            
-            # Validate block (only if AI extracted something)
-            block_id = None
-            if parsed_data.get('block_id') is not None:
-                block_id = self._validate_and_convert_id(parsed_data['block_id'], building_data.BlockList, 'block')
-                if block_id is None:
-                    suggestions = self._get_validation_suggestions(str(parsed_data['block_id']), building_data.BlockList, 'block')
-                    validation_errors.append({
-                        "field": "block",
-                        "extracted_value": str(parsed_data['block_id']),
-                        "issue": "not_found",
-                        "suggestions": suggestions
-                    })
-            logger.info(f"Converted block_id: {block_id}")
-            
-            # Validate floor (only if block is valid and AI extracted something)
-            floor_id = None
-            if block_id is not None and parsed_data.get('floor_id') is not None:
-                floor_id = self._validate_and_convert_floor_id(parsed_data['floor_id'], building_data.FloorList, block_id)
-                if floor_id is None:
-                    suggestions = self._get_validation_suggestions(str(parsed_data['floor_id']), building_data.FloorList, 'floor', block_id)
-                    validation_errors.append({
-                        "field": "floor", 
-                        "extracted_value": str(parsed_data['floor_id']),
-                        "issue": "not_in_block",
-                        "suggestions": suggestions
-                    })
+            parsed_data = await self._call_llm(text, building_data)
+            return self._validate_extraction(parsed_data, building_data, suggest)
+        except (KeyError, ValueError, TypeError, GeminiServiceError) as e:
+            logger.error("Error extracting visitor info: %s", e)
+            raise GeminiServiceError(f"Extraction failed: {str(e)}")
+    
+    async def _call_llm(self, text: str, building_data: BuildingData) -> Dict[str, Any]:
+        """Get the raw extracted fields from the n8n webhook (which calls Gemini via VPN)."""
+        prompt = self._create_visitor_prompt(text, building_data)
+        parsed_data = await self._make_n8n_request(prompt, building_data)
+        logger.debug("n8n extracted data: %s", parsed_data)
+        return parsed_data
+    
+    def _validate_extraction(self, parsed_data: Dict[str, Any], building_data: BuildingData, suggest: bool = True) -> Tuple[RawExtracted, float]:
+        """Validate the raw n8n fields against the building and convert them to IDs."""
+        # Validate required fields
+        missing = _REQUIRED_FIELDS.difference(parsed_data)
+        if missing:
+            raise GeminiServiceError(f"Missing required fields: {', '.join(sorted(missing))}")
+        
+        # Extract confidence (default to 0.8 if not provided)
+        confidence = _clamp(float(parsed_data.get('confidence', 0.8)), 0.0, 1.0)
+        
+        # Clean up "None" strings that AI might return when it can't identify data
+        for field in _APARTMENT_FIELDS:
+            value = parsed_data.get(field)
+            if isinstance(value, str) and value.lower() in _NULLISH:
+                parsed_data[field] = None
+        
+        # Validate and convert IDs - collect validation errors instead of guessing  
+        
+        validation_errors = []
+        # Suggestions only end up in the validation warning log
+        suggest = suggest and logger.isEnabledFor(logging.WARNING)
+        
+        # Validate block (only if AI extracted something)
+        block_id = None
+        if parsed_data.get('block_id') is not None:
+            block_id = self._validate_and_convert_block_id(parsed_data['block_id'], building_data)
+            if block_id is None:
+                suggestions = self._get_validation_suggestions(str(parsed_data['block_id']), building_data.BlockList) if suggest else []
+                validation_errors.append({
+                    "field": "block",
+                    "extracted_value": str(parsed_data['block_id']),
+                    "issue": "not_found",
+                    "suggestions": suggestions
+                })
+        
+        # Validate floor (only if block is valid and AI extracted something)
+        floor_id = None
+        if block_id is not None and parsed_data.get('floor_id') is not None:
+            floor_id = self._validate_and_convert_floor_id(parsed_data['floor_id'], building_data, block_id)
+            if floor_id is None:
+                if self._as_id(parsed_data['floor_id']) in building_data.floors_by_id:
+                    # A floor ID from another block
+                    issue, suggestions = "hierarchical_violation", []
                 else:
-                    # CRITICAL: Verify floor actually belongs to the block  
-                    floor_obj = next((f for f in building_data.FloorList if f.Id == floor_id), None)
-                    if floor_obj and floor_obj.BlockId != block_id:
-                        logger.warning(f"Hierarchical violation: floor_id {floor_id} belongs to block {floor_obj.BlockId}, not block {block_id}")
-                        validation_errors.append({
-                            "field": "floor",
-                            "extracted_value": str(parsed_data['floor_id']),
-                            "issue": "hierarchical_violation",
-                            "suggestions": []
-                        })
-                        floor_id = None  # Reset invalid floor
-            logger.info(f"Converted floor_id: {floor_id}")
-            
-            # Validate flat (only if floor is valid and AI extracted something)
-            flat_id = None
-            if floor_id is not None and parsed_data.get('flat_id') is not None:
-                flat_id = self._validate_and_convert_flat_id(parsed_data['flat_id'], building_data.UnitList, floor_id)
-                if flat_id is None:
-                    suggestions = self._get_validation_suggestions(str(parsed_data['flat_id']), building_data.UnitList, 'unit', floor_id)
-                    validation_errors.append({
-                        "field": "flat",
-                        "extracted_value": str(parsed_data['flat_id']),
-                        "issue": "not_on_floor", 
-                        "suggestions": suggestions
-                    })
+                    issue = "not_in_block"
+                    suggestions = self._get_validation_suggestions(str(parsed_data['floor_id']), building_data.floors_by_block.get(block_id, ())) if suggest else []
+                validation_errors.append({
+                    "field": "floor", 
+                    "extracted_value": str(parsed_data['floor_id']),
+                    "issue": issue,
+                    "suggestions": suggestions
+                })
+            elif __debug__:
+                # strict_parent lookups only return floors of the block
+                assert building_data.floors_by_id[floor_id].BlockId == block_id, (floor_id, block_id)
+        
+        # Validate flat (only if floor is valid and AI extracted something)
+        flat_id = None
+        if floor_id is not None and parsed_data.get('flat_id') is not None:
+            flat_id = self._validate_and_convert_flat_id(parsed_data['flat_id'], building_data, floor_id)
+            if flat_id is None:
+                if self._as_id(parsed_data['flat_id']) in building_data.flats_by_id:
+                    # A flat ID from another floor
+                    issue, suggestions = "hierarchical_violation", []
                 else:
-                    # CRITICAL: Verify unit actually belongs to the floor
-                    unit_obj = next((u for u in building_data.UnitList if u.Id == flat_id), None)
-                    if unit_obj and unit_obj.FloorId != floor_id:
-                        logger.warning(f"Hierarchical violation: flat_id {flat_id} belongs to floor {unit_obj.FloorId}, not floor {floor_id}")
-                        validation_errors.append({
-                            "field": "flat",
-                            "extracted_value": str(parsed_data['flat_id']),
-                            "issue": "hierarchical_violation",
-                            "suggestions": []
-                        })
-                        flat_id = None  # Reset invalid unit
-            logger.info(f"Converted flat_id: {flat_id}")
-            
-            # If there are validation errors, log them but continue with partial data
-            if validation_errors:
-                logger.warning(f"Validation errors found, proceeding with partial data: {validation_errors}")
-                # Reduce confidence score based on number of validation errors
-                confidence = confidence * (1.0 - (len(validation_errors) * 0.2))  # Reduce by 20% per error
-                confidence = max(0.1, confidence)  # Minimum 10% confidence
-            
-            # Debug: Show what was successfully validated
-            if flat_id and building_data.UnitList:
-                selected_unit = next((unit for unit in building_data.UnitList if unit.Id == flat_id), None)
-                if selected_unit:
-                    logger.info(f"Successfully validated apartment: {selected_unit.NameChi} (Id: {selected_unit.Id}, FloorId: {selected_unit.FloorId})")
-            
-            # Convert category name to ID
-            raw_main = parsed_data.get('main_category')
-            if isinstance(raw_main, int):
-                main_category_id = raw_main  # Trust n8n's integer
-            else:
-                main_category_id = self._convert_category_name_to_id(raw_main, building_data.VisitCat)
-            
-            # Validate and convert sub-category to NameChi string, if not found, return ""
-            sub_category_str = self._convert_subcategory_to_namechi(
-                parsed_data.get('sub_category'),
-                building_data.VisitSubCat
-            )
-            
-            # Create RawExtracted object
-            raw_extracted = RawExtracted(
-                visitor_name=str(parsed_data['visitor_name']),
-                block_id=block_id,
-                floor_id=floor_id,
-                flat_id=flat_id,
-                id_card_prefix=str(parsed_data['id_card_prefix']),
-                main_category=main_category_id,
-                sub_category=sub_category_str
-            )
-            
-            # Log completion status
-            apartment_fields_present = sum([1 for field in [block_id, floor_id, flat_id] if field is not None])
-            if apartment_fields_present == 3:
-                logger.info(f"Successfully extracted COMPLETE visitor info with confidence: {confidence} using n8n webhook")
-            elif apartment_fields_present > 0:
-                logger.info(f"Successfully extracted PARTIAL visitor info ({apartment_fields_present}/3 apartment fields) with confidence: {confidence} using n8n webhook")
-            else:
-                logger.info(f"Successfully extracted visitor info (NO apartment data) with confidence: {confidence} using n8n webhook")
-            
-            return raw_extracted, confidence
-            
-        except Exception as e:
-            logger.error(f"Error extracting visitor info: {str(e)}")
-            raise GeminiServiceError(f"Extraction failed: {str(e)}")
+                    issue = "not_on_floor"
+                    suggestions = self._get_validation_suggestions(str(parsed_data['flat_id']), building_data.flats_by_floor.get(floor_id, ())) if suggest else []
+                validation_errors.append({
+                    "field": "flat",
+                    "extracted_value": str(parsed_data['flat_id']),
+                    "issue": issue,
+                    "suggestions": suggestions
+                })
+            elif __debug__:
+                # strict_parent lookups only return flats on the floor
+                assert building_data.flats_by_id[flat_id].FloorId == floor_id, (flat_id, floor_id)
+        
+        # If there are validation errors, log them but continue with partial data
+        if validation_errors:
+            logger.warning("Validation errors found, proceeding with partial data: %s", validation_errors)
+            # Reduce confidence by 20% per validation error, to a minimum of 10%
+            confidence = _clamp(confidence * (1.0 - 0.2 * len(validation_errors)), 0.1, 1.0)
+        
+        # Convert category name to ID
+        raw_main = parsed_data.get('main_category')
+        if isinstance(raw_main, int):
+            main_category_id = raw_main  # Trust n8n's integer
+        else:
+            main_category_id = self._convert_category_name_to_id(raw_main, building_data)
+        
+        # Validate and convert sub-category to NameChi string, if not found, return ""
+        sub_category_str = self._convert_subcategory_to_namechi(
+            parsed_data.get('sub_category'),
+            building_data
+        )
+        
+        # Create RawExtracted object (every field is already converted, so skip validation)
+        visitor_name = parsed_data['visitor_name']
+        id_card_prefix = parsed_data['id_card_prefix']
+        raw_extracted = RawExtracted.model_construct(
+            visitor_name=visitor_name if type(visitor_name) is str else str(visitor_name),
+            block_id=block_id,
+            floor_id=floor_id,
+            flat_id=flat_id,
+            id_card_prefix=id_card_prefix if type(id_card_prefix) is str else str(id_card_prefix),
+            main_category=main_category_id,
+            sub_category=sub_category_str
+        )
+        
+        # One summary record per extraction (fields are also attached for structured handlers)
+        apartment_fields_present = (block_id is not None) + (floor_id is not None) + (flat_id is not None)
+        logger.info(
+            "Extracted visitor info (%s/3 apartment fields, %s validation errors) - block: %s, floor: %s, flat: %s, confidence: %s",
+            apartment_fields_present, len(validation_errors), block_id, floor_id, flat_id, confidence,
+            extra={
+                "block_id": block_id,
+                "floor_id": floor_id,
+                "flat_id": flat_id,
+                "confidence": confidence,
+                "apt_present": apartment_fields_present,
+                "validation_errors": len(validation_errors)
+            }
+        )
+        
+        return raw_extracted, confidence
 
 
-# Global service instance - created when first imported
+# Created by the app lifespan (see app.main), not at import time
 def get_gemini_service():
     """Get a fresh GeminiService instance."""
-    return GeminiService()
-
-gemini_service = get_gemini_service() 
\ No newline at end of file
+    return GeminiService() 
\ No newline at end of file
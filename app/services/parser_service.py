@@ -1,60 +1,199 @@
-from typing import Optional
-from app.services.whizprop_client import whizprop_client, WhizPropAPIError
-from app.services.gemini_service import gemini_service, GeminiServiceError
+from typing import Awaitable, Callable, Dict, Optional, List, Tuple
+from app.config.settings import settings
+from app.services.whizprop_client import WhizPropClient, WhizPropAPIError, get_whizprop_client
+from app.services.gemini_service import GeminiService, GeminiServiceError, get_gemini_service
 from app.models.responses import VisitorParseSuccessResponse, VisitorParseErrorResponse, ExtractedData, RawExtracted, ErrorResponse
 from app.models.whizprop import BuildingData
+import asyncio
+import httpx
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Failures reported as a VisitorParseErrorResponse; anything else is a bug and
+# propagates to the app-level exception handler
+_EXPECTED_ERRORS = (WhizPropAPIError, GeminiServiceError, asyncio.TimeoutError, ValueError, KeyError)
+
+
+class _BuildingCache:
+    """In-process TTL cache of WhizProp building data; concurrent misses share one fetch.
+    
+    Entries within refresh_ahead seconds of expiry are still served, while a
+    background fetch replaces them, so hot buildings never expire on a request.
+    """
+    
+    def __init__(self, fetch: Callable[[int], Awaitable[BuildingData]], ttl: float, refresh_ahead: float = 0.0):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self._entries: Dict[int, Tuple[float, BuildingData]] = {}
+        self._inflight: Dict[int, asyncio.Task] = {}
+    
+    async def get(self, building_id: int) -> BuildingData:
+        """Get building data from the cache, fetching it from WhizProp on a miss."""
+        entry = self._entries.get(building_id)
+        if entry is not None:
+            remaining = entry[0] - time.monotonic()
+            if remaining > 0:
+                if remaining <= self.refresh_ahead and building_id not in self._inflight:
+                    self._start_fill(building_id).add_done_callback(self._log_refresh_failure)
+                return entry[1]
+        
+        task = self._inflight.get(building_id) or self._start_fill(building_id)
+        # Shielded so one cancelled caller does not abort the fetch for the others
+        return await asyncio.shield(task)
+    
+    async def get_many(self, building_ids) -> Dict[int, object]:
+        """Get several buildings concurrently, each fetched at most once.
+        
+        Maps each distinct building ID to its BuildingData, or to the exception
+        raised while fetching it.
+        """
+        unique_ids = list(dict.fromkeys(building_ids))
+        fetched = await asyncio.gather(*(self.get(building_id) for building_id in unique_ids), return_exceptions=True)
+        return dict(zip(unique_ids, fetched))
+    
+    def _start_fill(self, building_id: int) -> asyncio.Task:
+        task = asyncio.create_task(self._fill(building_id))
+        self._inflight[building_id] = task
+        task.add_done_callback(lambda _: self._inflight.pop(building_id, None))
+        return task
+    
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Task):
+        # The stale entry keeps being served until it expires
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background building data refresh failed: %s", task.exception())
+    
+    async def _fill(self, building_id: int) -> BuildingData:
+        # Returned with its lookup indexes already built
+        building_data = await self._fetch(building_id)
+        if self.ttl > 0:
+            self._entries[building_id] = (time.monotonic() + self.ttl, building_data)
+        return building_data
+    
+    def invalidate(self, building_id: Optional[int] = None):
+        """Drop one building (or every building) so the next request refetches it."""
+        if building_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(building_id, None)
+
 
 class VisitorParserService:
     """Main service for parsing visitor information."""
     
+    def __init__(self, gemini_service: Optional[GeminiService] = None, whizprop_client: Optional[WhizPropClient] = None):
+        self.buildings = _BuildingCache(self._fetch_building, settings.building_cache_ttl, settings.building_cache_refresh_ahead)
+        # Injected by the app lifespan, created lazily otherwise
+        self._gemini_service = gemini_service
+        self._whizprop_client = whizprop_client
+    
+    def use_whizprop_client(self, whizprop_client: WhizPropClient):
+        """Use an externally created WhizPropClient for building data."""
+        self._whizprop_client = whizprop_client
+    
+    def _get_whizprop_client(self) -> WhizPropClient:
+        """Get the WhizPropClient, creating one on first use if none was injected."""
+        if self._whizprop_client is None:
+            self._whizprop_client = get_whizprop_client()
+        return self._whizprop_client
+    
+    async def _fetch_building(self, building_id: int) -> BuildingData:
+        return await self._get_whizprop_client().get_building_settings(building_id)
+    
+    def use_gemini_service(self, gemini_service: GeminiService):
+        """Use an externally created GeminiService for extraction."""
+        self._gemini_service = gemini_service
+    
+    def _get_gemini_service(self) -> GeminiService:
+        """Get the GeminiService, creating one on first use if none was injected."""
+        if self._gemini_service is None:
+            self._gemini_service = get_gemini_service()
+        return self._gemini_service
+    
+    def use_http_client(self, client: httpx.AsyncClient):
+        """Share one pooled HTTP client across the WhizProp and Gemini services."""
+        self._get_whizprop_client().use_http_client(client)
+        self._get_gemini_service().use_http_client(client)
+    
     async def parse_visitor_info(self, building_id: int, text: str):
         """Parse visitor information from text input."""
         try:
             # Step 1: Get building data from WhizProp
-            logger.info(f"Parsing visitor info for building {building_id}")
-            building_data = await whizprop_client.get_building_settings(building_id)
+            logger.info("Parsing visitor info for building %s", building_id)
+            building_data = await self.buildings.get(building_id)
             
-            # Step 2: Extract information using Gemini AI
-            raw_extracted, confidence = await gemini_service.extract_visitor_info(text, building_data)
+            return await self._parse_with_building_data(text, building_data)
             
-            # Step 3: Validate and map to IDs
-            extracted_data = await self._validate_and_map_data(raw_extracted, building_data, text)
-            
-            # Step 4: Use categories from Gemini extraction
-            extracted_data.main_category = raw_extracted.main_category
-            extracted_data.sub_category = raw_extracted.sub_category
-            
-            # Return success response
-            return VisitorParseSuccessResponse(
-                data=extracted_data,
-                confidence=confidence
-            )
-            
-        except WhizPropAPIError as e:
-            logger.error(f"WhizProp API error: {str(e)}")
-            return VisitorParseErrorResponse(
-                message=f"Building data retrieval failed: {str(e)}"
-            )
-        except GeminiServiceError as e:
-            logger.error(f"Gemini service error: {str(e)}")
+        except _EXPECTED_ERRORS as e:
+            return self._error_response(e)
+    
+    async def parse_many(self, items: List[Tuple[int, str]]) -> list:
+        """Parse several (building_id, text) requests, fetching each building's data only once.
+        
+        An unexpected error is returned in place of that item's response, so it
+        does not fail the rest of the batch.
+        """
+        building_data_by_id = await self.buildings.get_many(building_id for building_id, _ in items)
+        logger.info("Parsing batch of %s requests across %s buildings", len(items), len(building_data_by_id))
+        
+        async def parse_one(building_id: int, text: str):
+            building_data = building_data_by_id[building_id]
+            if isinstance(building_data, BaseException):
+                return self._error_response(building_data)
+            try:
+                return await self._parse_with_building_data(text, building_data)
+            except _EXPECTED_ERRORS as e:
+                return self._error_response(e)
+        
+        return await asyncio.gather(
+            *(parse_one(building_id, text) for building_id, text in items),
+            return_exceptions=True
+        )
+    
+    async def _parse_with_building_data(self, text: str, building_data: BuildingData) -> VisitorParseSuccessResponse:
+        """Run extraction and validation for one text against already-fetched building data."""
+        # Step 2: Extract information using Gemini AI
+        raw_extracted, confidence = await self._get_gemini_service().extract_visitor_info(text, building_data)
+        
+        # Step 3: Validate and map to IDs
+        extracted_data = self._validate_and_map_data(raw_extracted, building_data, text)
+        
+        # Return success response (fields are already validated; confidence is clamped by GeminiService)
+        return VisitorParseSuccessResponse.model_construct(
+            status="success",
+            data=extracted_data,
+            confidence=confidence
+        )
+    
+    def _error_response(self, error: BaseException) -> VisitorParseErrorResponse:
+        """Map a parsing failure to an error response."""
+        if not isinstance(error, _EXPECTED_ERRORS):
+            # Never swallow cancellation or unexpected errors
+            raise error
+        
+        if isinstance(error, WhizPropAPIError):
+            logger.error("WhizProp API error: %s", error)
             return VisitorParseErrorResponse(
-                message=f"Text parsing failed: {str(e)}"
+                message=f"Building data retrieval failed: {str(error)}"
             )
-        except Exception as e:
-            logger.error(f"Unexpected error in visitor parsing: {str(e)}")
+        if isinstance(error, GeminiServiceError):
+            logger.error("Gemini service error: %s", error)
             return VisitorParseErrorResponse(
-                message=f"Parsing failed: {str(e)}"
+                message=f"Text parsing failed: {str(error)}"
             )
+        logger.error("Visitor parsing error: %s", error)
+        return VisitorParseErrorResponse(
+            message=f"Parsing failed: {str(error)}"
+        )
     
-    async def _validate_and_map_data(self, raw_extracted: RawExtracted, building_data: BuildingData, original_text: str) -> ExtractedData:
+    def _validate_and_map_data(self, raw_extracted: RawExtracted, building_data: BuildingData, original_text: str) -> ExtractedData:
         """Create ExtractedData from validated RawExtracted data."""
         
-        # Since GeminiService already validates and converts IDs, we can directly map
-        extracted_data = ExtractedData(
+        # Since GeminiService already validates and converts IDs (and categories), we can directly map
+        extracted_data = ExtractedData.model_construct(
             visitor_name=raw_extracted.visitor_name,
             block_id=raw_extracted.block_id,
             floor_id=raw_extracted.floor_id,
@@ -64,10 +203,10 @@ class VisitorParserService:
             sub_category=raw_extracted.sub_category
         )
         
-        logger.info(f"Parsed location '{original_text[:50]}...' -> Block: {extracted_data.block_id}, Floor: {extracted_data.floor_id}, Flat: {extracted_data.flat_id}")
+        logger.info("Parsed location '%s...' -> Block: %s, Floor: %s, Flat: %s", original_text[:50], extracted_data.block_id, extracted_data.floor_id, extracted_data.flat_id)
         
         return extracted_data
-    
 
-# Global instance
-visitor_parser = VisitorParserService() 
\ No newline at end of file
+
+# Global instances
+visitor_parser = VisitorParserService()
@@ -1,20 +1,43 @@
 import httpx
 import asyncio
 from typing import Optional, Dict, Any
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from app.config.settings import settings
-from app.models.whizprop import WhizPropResponse, BuildingData
+from app.models.whizprop import WhizPropResponse, BuildingData, normalize_name
 import logging
+import orjson
+import random
+import time
 
 logger = logging.getLogger(__name__)
 
+# Seconds before actual expiry at which tokens are refreshed
+TOKEN_EXPIRY_BUFFER = 300.0
+
+# Shortest wait before a background refresh, so a token issued with
+# expires_in <= TOKEN_EXPIRY_BUFFER cannot make refreshes run back to back
+PROACTIVE_REFRESH_MIN_DELAY = 30.0
+
+# Backoff between retries of 5xx responses and connection errors
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_CAP = 8.0
+
+# API endpoints, relative to the base URL (no leading slash)
+_TOKEN_ENDPOINT = "Account/RequestSessionToken"
+_LOGIN_ENDPOINT = "Authorization/Login"
+_LANDING_INFO_ENDPOINT = "Account/GetLandingInfo"
+_BUILDING_SETTING_ENDPOINT = "Visitor/GetVisitorBuildingSetting"
+
 
 @dataclass
 class AuthToken:
     access_token: str
-    expires_at: datetime
+    expires_at: datetime  # Wall-clock, for logging
+    expires_at_monotonic: float  # time.monotonic() deadline used for expiry checks
     refresh_token: Optional[str] = None
+    # Authenticated request headers, built once per token
+    headers: Dict[str, str] = field(default_factory=dict)
 
 
 class WhizPropAPIError(Exception):
@@ -22,11 +45,18 @@ class WhizPropAPIError(Exception):
     pass
 
 
+def _retry_delay(attempt: int) -> float:
+    """Jittered exponential backoff before retry number attempt + 1."""
+    return min(RETRY_BACKOFF_BASE * 2 ** attempt, RETRY_BACKOFF_CAP) * random.uniform(0.75, 1.25)
+
+
 class WhizPropClient:
     """Client for WhizProp CS API integration with dynamic token management."""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         self.base_url = settings.effective_base_url
+        # Normalized once; endpoint URLs are f"{self._base_url}/{endpoint}"
+        self._base_url = self.base_url.rstrip('/')
         
         # Only need API key from environment (doesn't expire)
         self.api_key = settings.effective_api_key
@@ -37,8 +67,21 @@ class WhizPropClient:
         
         # Dynamic token management (no static tokens from .env)
         self._device_id: Optional[str] = settings.effective_device_id
+        # In-flight device ID retrieval, so concurrent first callers make one call
+        self._device_id_task: Optional[asyncio.Task] = None
         self._auth_token: Optional[AuthToken] = None
-        self._auth_lock = asyncio.Lock()
+        # In-flight token refresh shared by every caller that finds the token expired
+        self._token_refresh: Optional[asyncio.Task] = None
+        # Timer that refreshes the token before it expires, off the request path
+        self._proactive_refresh: Optional[asyncio.Task] = None
+        
+        # Shared HTTP client (injected by the app lifespan, created lazily otherwise)
+        self._http_client: Optional[httpx.AsyncClient] = http_client
+        self._owns_http_client = False
+        self._http_version_logged = False
+        
+        # Bounds in-flight API calls so bursts queue here instead of exhausting the pool
+        self._semaphore = asyncio.Semaphore(max(1, settings.max_concurrent_whizprop))
         
         # Determine authentication capabilities
         self.can_get_tokens = bool(self.api_key)
@@ -47,26 +90,44 @@ class WhizPropClient:
         if not self.can_get_tokens:
             raise ValueError("API key is required for token management")
         
-        logger.info(f"WhizProp client initialized with dynamic token management")
-        logger.info(f"Base URL: {self.base_url}")
-        logger.info(f"Device ID: {self._device_id or 'Will retrieve dynamically'}")
-        logger.info(f"API Key configured: {bool(self.api_key)}")
-        logger.info(f"Can get tokens: {self.can_get_tokens}")
-        logger.info(f"Can auto-login: {self.can_auto_login}")
+        logger.info("WhizProp client initialized with dynamic token management")
+        logger.info("Base URL: %s", self.base_url)
+        logger.info("Device ID: %s", self._device_id or 'Will retrieve dynamically')
+        logger.info("API Key configured: %s", bool(self.api_key))
+        logger.info("Can get tokens: %s", self.can_get_tokens)
+        logger.info("Can auto-login: %s", self.can_auto_login)
+    
+    def use_http_client(self, client: httpx.AsyncClient):
+        """Use a shared, externally managed HTTP client for API calls."""
+        self._http_client = client
+        self._owns_http_client = False
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Get the pooled HTTP client, creating one on first use if none was injected."""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(http2=True, timeout=30.0)
+            self._owns_http_client = True
+        return self._http_client
+    
+    async def aclose(self):
+        """Stop the background token refresh and close the HTTP client if this client created it."""
+        if self._proactive_refresh is not None:
+            self._proactive_refresh.cancel()
+            self._proactive_refresh = None
+        if self._owns_http_client and self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+        self._owns_http_client = False
     
-    async def _is_token_expired(self) -> bool:
+    def _is_token_expired(self) -> bool:
         """Check if current token is expired or will expire soon (within 5 minutes)"""
-        if not self._auth_token:
-            return True
-        
-        # Add 5-minute buffer before actual expiration
-        buffer_time = timedelta(minutes=5)
-        return datetime.now() >= (self._auth_token.expires_at - buffer_time)
+        # Monotonic, so wall-clock adjustments cannot expire (or extend) a token
+        return not self._auth_token or time.monotonic() >= self._auth_token.expires_at_monotonic - TOKEN_EXPIRY_BUFFER
     
     async def _get_fresh_token(self) -> bool:
         """Get a fresh token using RequestSessionToken endpoint"""
         device_id = await self.get_device_id()
-        token_url = f"{self.base_url.rstrip('/')}/Account/RequestSessionToken"
+        token_url = f"{self._base_url}/{_TOKEN_ENDPOINT}"
         
         params = {
             "deviceId": device_id
@@ -79,48 +140,56 @@ class WhizPropClient:
         
         try:
             logger.info("Getting fresh token using RequestSessionToken endpoint...")
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(token_url, headers=headers, params=params)
+            client = self._get_http_client()
+            response = await client.post(token_url, headers=headers, params=params, timeout=30.0)
+            
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    
-                    if result.get("status") == 1 and result.get("data"):
-                        token_data = result["data"]
-                        access_token = token_data.get("access_token")
-                        expires_in = token_data.get("expires_in", 7200)  # Default 2 hours
-                        refresh_token = token_data.get("refresh_token")
-                        
-                        if access_token:
-                            # Calculate expiration time
-                            expires_at = datetime.now() + timedelta(seconds=expires_in)
-                            
-                            self._auth_token = AuthToken(
-                                access_token=access_token,
-                                expires_at=expires_at,
-                                refresh_token=refresh_token
-                            )
-                            
-                            logger.info(f"Fresh token obtained successfully. Expires at: {expires_at}")
-                            return True
-                    
-                    logger.error(f"Failed to get fresh token: {result}")
-                    return False
-                else:
-                    error_text = response.text
-                    logger.error(f"Token request failed with status {response.status_code}: {error_text}")
-                    return False
+                if result.get("status") == 1 and result.get("data"):
+                    token_data = result["data"]
+                    access_token = token_data.get("access_token")
+                    expires_in = token_data.get("expires_in", 7200)  # Default 2 hours
+                    refresh_token = token_data.get("refresh_token")
                     
+                    if access_token:
+                        expires_at = self._store_token(access_token, expires_in, refresh_token)
+                        logger.info("Fresh token obtained successfully. Expires at: %s", expires_at)
+                        return True
+                
+                logger.error("Failed to get fresh token: %s", result)
+                return False
+            else:
+                error_text = response.text
+                logger.error("Token request failed with status %s: %s", response.status_code, error_text)
+                return False
+                
         except Exception as e:
-            logger.error(f"Error getting fresh token: {str(e)}")
+            logger.error("Error getting fresh token: %s", e)
             return False
     
+    def _store_token(self, access_token: str, expires_in: float, refresh_token: Optional[str]) -> datetime:
+        """Make a newly acquired token current and return its (wall-clock) expiry"""
+        expires_at = datetime.now() + timedelta(seconds=expires_in)
+        self._auth_token = AuthToken(
+            access_token=access_token,
+            expires_at=expires_at,
+            expires_at_monotonic=time.monotonic() + expires_in,
+            refresh_token=refresh_token,
+            headers={
+                "Apikey": self.api_key,
+                "Access_token": access_token,
+                "Content-Type": "application/json"
+            }
+        )
+        return expires_at
+    
     async def _authenticate_with_credentials(self) -> bool:
         """Authenticate using username/password if available"""
         if not self.can_auto_login:
             return False
         
-        auth_url = f"{self.base_url.rstrip('/')}/Authorization/Login"
+        auth_url = f"{self._base_url}/{_LOGIN_ENDPOINT}"
         
         auth_data = {
             "deviceId": await self.get_device_id(),
@@ -130,60 +199,98 @@ class WhizPropClient:
         
         try:
             logger.info("Authenticating with username/password...")
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(auth_url, json=auth_data)
+            client = self._get_http_client()
+            response = await client.post(auth_url, json=auth_data, timeout=30.0)
+            
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    
-                    if result.get("status") == 1 and result.get("data"):
-                        token_data = result["data"]
-                        access_token = token_data.get("AccessToken")
-                        expires_in = token_data.get("ExpiresIn", 3600)  # Default 1 hour
-                        
-                        if access_token:
-                            expires_at = datetime.now() + timedelta(seconds=expires_in)
-                            
-                            self._auth_token = AuthToken(
-                                access_token=access_token,
-                                expires_at=expires_at,
-                                refresh_token=token_data.get("RefreshToken")
-                            )
-                            
-                            logger.info(f"Authentication successful. Token expires at: {expires_at}")
-                            return True
-                    
-                    logger.error(f"Authentication failed: {result}")
-                    return False
-                else:
-                    error_text = response.text
-                    logger.error(f"Authentication request failed with status {response.status_code}: {error_text}")
-                    return False
+                if result.get("status") == 1 and result.get("data"):
+                    token_data = result["data"]
+                    access_token = token_data.get("AccessToken")
+                    expires_in = token_data.get("ExpiresIn", 3600)  # Default 1 hour
                     
+                    if access_token:
+                        expires_at = self._store_token(access_token, expires_in, token_data.get("RefreshToken"))
+                        logger.info("Authentication successful. Token expires at: %s", expires_at)
+                        return True
+                
+                logger.error("Authentication failed: %s", result)
+                return False
+            else:
+                error_text = response.text
+                logger.error("Authentication request failed with status %s: %s", response.status_code, error_text)
+                return False
+                
         except Exception as e:
-            logger.error(f"Authentication error: {str(e)}")
+            logger.error("Authentication error: %s", e)
             return False
     
     async def _ensure_valid_token(self) -> bool:
         """Ensure we have a valid, non-expired token"""
-        async with self._auth_lock:
-            if await self._is_token_expired():
-                logger.info("Token expired or missing, getting fresh token...")
-                
-                # Try to get fresh token using API key first
-                if await self._get_fresh_token():
-                    return True
-                
-                # Fall back to credential-based authentication if available
-                if self.can_auto_login:
-                    logger.info("Trying credential-based authentication as fallback...")
-                    if await self._authenticate_with_credentials():
-                        return True
-                
-                logger.error("All token acquisition methods failed")
-                return False
-            
+        # Fast path: a fresh token needs no coordination
+        if not self._is_token_expired():
             return True
+        
+        # Shielded so one cancelled caller does not abort the refresh for the others
+        return await asyncio.shield(self._start_token_refresh())
+    
+    def _start_token_refresh(self) -> asyncio.Task:
+        """Get the in-flight token refresh, starting one if none is running"""
+        task = self._token_refresh
+        if task is None:
+            task = asyncio.create_task(self._refresh_token())
+            self._token_refresh = task
+            task.add_done_callback(self._clear_token_refresh)
+        return task
+    
+    def _clear_token_refresh(self, task: asyncio.Task):
+        if self._token_refresh is task:
+            self._token_refresh = None
+    
+    async def _refresh_token(self) -> bool:
+        """Acquire a new token, trying the API key first and then credentials"""
+        logger.info("Token expired or missing, getting fresh token...")
+        
+        # Try to get fresh token using API key first, then fall back to
+        # credential-based authentication if available
+        acquired = await self._get_fresh_token()
+        if not acquired and self.can_auto_login:
+            logger.info("Trying credential-based authentication as fallback...")
+            acquired = await self._authenticate_with_credentials()
+        
+        if not acquired:
+            logger.error("All token acquisition methods failed")
+            return False
+        
+        self._schedule_proactive_refresh()
+        return True
+    
+    def _schedule_proactive_refresh(self):
+        """Refresh the new token as soon as it is due, so no request waits on it."""
+        # A timer that fired has already cleared itself, so this only replaces a pending one
+        if self._proactive_refresh is not None:
+            self._proactive_refresh.cancel()
+        due_in = self._auth_token.expires_at_monotonic - TOKEN_EXPIRY_BUFFER - time.monotonic()
+        self._proactive_refresh = asyncio.create_task(
+            self._refresh_when_due(max(due_in, PROACTIVE_REFRESH_MIN_DELAY))
+        )
+    
+    async def _refresh_when_due(self, delay: float):
+        await asyncio.sleep(delay)
+        # This timer is done; only a successful refresh schedules the next one
+        if self._proactive_refresh is asyncio.current_task():
+            self._proactive_refresh = None
+        
+        logger.info("Refreshing token ahead of expiry")
+        try:
+            refreshed = await asyncio.shield(self._start_token_refresh())
+        except Exception as e:
+            logger.error("Proactive token refresh failed: %s", e)
+            return
+        if not refreshed:
+            # The next request past expiry retries and, on success, reschedules
+            logger.warning("Proactive token refresh failed")
     
     async def _get_headers(self) -> Dict[str, str]:
         """Get request headers with valid access token"""
@@ -193,74 +300,77 @@ class WhizPropClient:
             raise WhizPropAPIError("Failed to obtain valid authentication token")
         
         # Use the current access token
-        if self._auth_token:
-            return {
-                "Apikey": self.api_key,
-                "Access_token": self._auth_token.access_token,
-                "Content-Type": "application/json"
-            }
-        else:
+        token = self._auth_token
+        if not token:
             raise WhizPropAPIError("No valid authentication token available")
+        return token.headers
     
     async def _make_request(self, endpoint: str, method: str = "GET", params: Optional[Dict] = None, max_retries: int = 3) -> Dict[str, Any]:
         """Make HTTP request to WhizProp API with automatic token refresh on failures."""
-        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
+        url = f"{self._base_url}/{endpoint}"
         last_error = None
         
         for attempt in range(max_retries):
             try:
                 headers = await self._get_headers()
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
+                client = self._get_http_client()
+                async with self._semaphore:
                     if method.upper() == "GET":
-                        response = await client.get(url, headers=headers, params=params or {})
+                        response = await client.get(url, headers=headers, params=params or {}, timeout=30.0)
                     elif method.upper() == "POST":
-                        response = await client.post(url, headers=headers, params=params or {})
+                        response = await client.post(url, headers=headers, params=params or {}, timeout=30.0)
                     else:
                         raise WhizPropAPIError(f"Unsupported HTTP method: {method}")
+                
+                # Handle authentication failures
+                if response.status_code == 401:
+                    error_text = response.text
+                    logger.warning("Received 401 Unauthorized on attempt %s: %s", attempt + 1, error_text)
                     
-                    # Handle authentication failures
-                    if response.status_code == 401:
-                        error_text = response.text
-                        logger.warning(f"Received 401 Unauthorized on attempt {attempt + 1}: {error_text}")
-                        
-                        # Force token refresh and retry
-                        if attempt < max_retries - 1:
-                            logger.info("Forcing token refresh due to 401")
-                            self._auth_token = None  # Force fresh token
-                            continue
-                        else:
-                            raise WhizPropAPIError("Authentication failed after multiple attempts")
-                    
-                    if response.status_code == 200:
-                        return response.json()
+                    # Force token refresh and retry
+                    if attempt < max_retries - 1:
+                        logger.info("Forcing token refresh due to 401")
+                        self._auth_token = None  # Force fresh token
+                        continue
                     else:
-                        error_text = response.text
-                        last_error = f"HTTP {response.status_code}: {error_text}"
-                        logger.error(f"Request failed with status {response.status_code}: {error_text}")
+                        raise WhizPropAPIError("Authentication failed after multiple attempts")
+                
+                if not self._http_version_logged:
+                    # Confirms whether ALPN negotiated HTTP/2 multiplexing with the API host
+                    logger.debug("WhizProp API connection uses %s", response.http_version)
+                    self._http_version_logged = True
+                
+                if response.status_code == 200:
+                    return orjson.loads(response.content)
+                
+                error_text = response.text
+                last_error = f"HTTP {response.status_code}: {error_text}"
+                logger.error("Request failed with status %s: %s", response.status_code, error_text)
+                
+                # Only server errors are worth retrying; other client errors would fail again
+                if response.status_code < 500:
+                    raise WhizPropAPIError(last_error)
                         
-                        # Don't retry for non-auth errors
-                        if response.status_code != 401:
-                            raise WhizPropAPIError(last_error)
-                            
-            except httpx.HTTPStatusError as e:
-                last_error = f"HTTP error: {e.response.status_code}"
-                logger.error(f"WhizProp API HTTP error: {e.response.status_code} - {e.response.text}")
             except httpx.RequestError as e:
                 last_error = f"Request error: {str(e)}"
-                logger.error(f"WhizProp API request error: {str(e)}")
+                logger.error("WhizProp API request error: %s", e)
             except WhizPropAPIError:
                 # Re-raise WhizPropAPIError as-is
                 raise
             except Exception as e:
-                last_error = f"Unexpected error: {str(e)}"
-                logger.error(f"WhizProp API unexpected error: {str(e)}")
+                logger.error("WhizProp API unexpected error: %s", e)
+                raise WhizPropAPIError(f"Unexpected error: {str(e)}")
+            
+            # 5xx or connection error: back off so concurrent callers don't retry in lockstep
+            if attempt < max_retries - 1:
+                await asyncio.sleep(_retry_delay(attempt))
         
         raise WhizPropAPIError(f"Max retries exceeded. Last error: {last_error}")
     
     async def _make_unauthenticated_request(self, endpoint: str, method: str = "GET", params: Optional[Dict] = None) -> Dict[str, Any]:
         """Make HTTP request without access token (for getting device ID)."""
-        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
+        url = f"{self._base_url}/{endpoint}"
         
         headers = {
             "Apikey": self.api_key,
@@ -268,38 +378,52 @@ class WhizPropClient:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            client = self._get_http_client()
+            async with self._semaphore:
                 if method.upper() == "GET":
-                    response = await client.get(url, headers=headers, params=params or {})
+                    response = await client.get(url, headers=headers, params=params or {}, timeout=30.0)
                 elif method.upper() == "POST":
-                    response = await client.post(url, headers=headers, params=params or {})
+                    response = await client.post(url, headers=headers, params=params or {}, timeout=30.0)
                 else:
                     raise WhizPropAPIError(f"Unsupported HTTP method: {method}")
-                
-                response.raise_for_status()
-                return response.json()
-                
+            
+            response.raise_for_status()
+            return orjson.loads(response.content)
+            
         except httpx.HTTPStatusError as e:
-            logger.error(f"WhizProp API HTTP error: {e.response.status_code} - {e.response.text}")
+            logger.error("WhizProp API HTTP error: %s - %s", e.response.status_code, e.response.text)
             raise WhizPropAPIError(f"API request failed: {e.response.status_code}")
         except httpx.RequestError as e:
-            logger.error(f"WhizProp API request error: {str(e)}")
+            logger.error("WhizProp API request error: %s", e)
             raise WhizPropAPIError(f"Request failed: {str(e)}")
         except Exception as e:
-            logger.error(f"WhizProp API unexpected error: {str(e)}")
+            logger.error("WhizProp API unexpected error: %s", e)
             raise WhizPropAPIError(f"Unexpected error: {str(e)}")
     
     async def get_device_id(self) -> str:
         """Get or retrieve device ID for API authentication."""
         
-        # If device_id is configured in settings, use it
+        # If device_id is configured (or was already retrieved), use it
         if self._device_id:
             return self._device_id
         
-        # Otherwise, retrieve device ID from API
+        # Otherwise, retrieve device ID from API, once for all concurrent callers
+        task = self._device_id_task
+        if task is None:
+            task = asyncio.create_task(self._retrieve_device_id())
+            self._device_id_task = task
+            task.add_done_callback(self._clear_device_id_task)
+        return await asyncio.shield(task)
+    
+    def _clear_device_id_task(self, task: asyncio.Task):
+        if self._device_id_task is task:
+            self._device_id_task = None
+    
+    async def _retrieve_device_id(self) -> str:
+        """Retrieve a device ID from the API (Account/GetLandingInfo)."""
         try:
             response_data = await self._make_unauthenticated_request(
-                "Account/GetLandingInfo",
+                _LANDING_INFO_ENDPOINT,
                 method="POST",
                 params={
                     "NotificationProvider": "2",
@@ -315,13 +439,13 @@ class WhizPropClient:
             
             if response_data.get("status") == 1:
                 self._device_id = response_data["data"]["deviceId"]
-                logger.info(f"Retrieved device ID: {self._device_id}")
+                logger.info("Retrieved device ID: %s", self._device_id)
                 return self._device_id
             else:
                 raise WhizPropAPIError(f"Failed to get device ID: {response_data.get('errMsg', 'Unknown error')}")
                 
         except Exception as e:
-            logger.error(f"Error getting device ID: {str(e)}")
+            logger.error("Error getting device ID: %s", e)
             raise WhizPropAPIError(f"Device ID retrieval failed: {str(e)}")
     
     async def get_building_settings(self, building_id: int) -> BuildingData:
@@ -330,7 +454,7 @@ class WhizPropClient:
             device_id = await self.get_device_id()
             
             response_data = await self._make_request(
-                "Visitor/GetVisitorBuildingSetting",
+                _BUILDING_SETTING_ENDPOINT,
                 method="POST",
                 params={
                     "deviceId": device_id,
@@ -339,57 +463,58 @@ class WhizPropClient:
             )
             
             # Parse response using Pydantic model
-            whizprop_response = WhizPropResponse(**response_data)
+            whizprop_response = WhizPropResponse.model_validate(response_data)
             
             if whizprop_response.status == 1:
-                logger.info(f"Successfully retrieved building settings for building {building_id} - "
-                           f"{len(whizprop_response.data.BlockList)} blocks, "
-                           f"{len(whizprop_response.data.FloorList)} floors, "
-                           f"{len(whizprop_response.data.UnitList)} units")
-                return whizprop_response.data
+                if logger.isEnabledFor(logging.INFO):
+                    data = whizprop_response.data
+                    logger.info("Successfully retrieved building settings for building %s - %s blocks, %s floors, %s units",
+                                building_id, len(data.BlockList), len(data.FloorList), len(data.UnitList))
+                # Indexes are built once here, so every lookup on the result only touches dicts
+                return whizprop_response.data.build_indexes()
             else:
                 raise WhizPropAPIError(f"Building settings request failed: {whizprop_response.errMsg}")
                 
         except Exception as e:
-            logger.error(f"Error getting building settings: {str(e)}")
+            logger.error("Error getting building settings: %s", e)
             if isinstance(e, WhizPropAPIError):
                 raise
             raise WhizPropAPIError(f"Building settings retrieval failed: {str(e)}")
     
     async def find_block_by_name(self, building_data: BuildingData, block_name: str) -> Optional[int]:
         """Find block ID by Chinese or English name."""
-        block_name_clean = block_name.strip().upper()
+        block_name_clean = block_name.strip()
+        block_id = building_data.block_id_by_norm_name.get(normalize_name(block_name_clean))
+        if block_id is not None:
+            return block_id
         
-        for block in building_data.BlockList:
-            if (block_name_clean in block.NameChi.upper() or 
-                block_name_clean in block.NameEng.upper() or
-                block_name_clean == str(block.Seq)):
-                return block.Id
-        return None
+        block = building_data.block_matcher.match_containing(block_name_clean, seq=True)
+        return block.Id if block is not None else None
     
     async def find_floor_by_name(self, building_data: BuildingData, block_id: int, floor_name: str) -> Optional[int]:
         """Find floor ID by name within a specific block."""
-        floor_name_clean = floor_name.strip().upper()
+        floor_name_clean = floor_name.strip()
+        floor_id = building_data.floor_id_by_block_norm_name.get((block_id, normalize_name(floor_name_clean)))
+        if floor_id is not None:
+            return floor_id
         
-        for floor in building_data.FloorList:
-            if floor.BlockId == block_id:
-                if (floor_name_clean in floor.NameChi.upper() or 
-                    floor_name_clean in floor.NameEng.upper() or
-                    floor_name_clean == str(floor.Seq)):
-                    return floor.Id
-        return None
+        matcher = building_data.floor_matchers_by_block.get(block_id)
+        floor = matcher.match_containing(floor_name_clean, seq=True) if matcher is not None else None
+        return floor.Id if floor is not None else None
     
     async def find_flat_by_name(self, building_data: BuildingData, floor_id: int, flat_name: str) -> Optional[int]:
         """Find flat ID by name within a specific floor."""
-        flat_name_clean = flat_name.strip().upper()
+        flat_name_clean = flat_name.strip()
+        flat_id = building_data.flat_id_by_floor_norm_name.get((floor_id, normalize_name(flat_name_clean)))
+        if flat_id is not None:
+            return flat_id
         
-        for flat in building_data.UnitList:
-            if flat.FloorId == floor_id:
-                if (flat_name_clean in flat.NameChi.upper() or 
-                    flat_name_clean in flat.NameEng.upper()):
-                    return flat.Id
-        return None
+        matcher = building_data.flat_matchers_by_floor.get(floor_id)
+        flat = matcher.match_containing(flat_name_clean) if matcher is not None else None
+        return flat.Id if flat is not None else None
 
 
-# Global instance
-whizprop_client = WhizPropClient() 
\ No newline at end of file
+# Created by the app lifespan (see app.main), not at import time
+def get_whizprop_client():
+    """Get a fresh WhizPropClient instance."""
+    return WhizPropClient() 
\ No newline at end of file
@@ -3,90 +3,192 @@ Demo script to test the AI Visitor Registration API
 """
 import asyncio
 import httpx
-import json
+import orjson
 import sys
 import os
-from typing import Dict, Any
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
 
 # Add parent directory to path so we can import from app
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Demo configuration
 BASE_URL = "http://localhost:8000"
-TEST_CASES = [
-    {
-        "name": "Chinese Delivery (FoodPanda)",
-        "building_id": 2,
-        "text": "我叫李先生，送外賣到2座15樓A室，身份證A123，是熊猫外賣"
-    },
-    {
-        "name": "Chinese Delivery (Keeta)", 
-        "building_id": 2,
-        "text": "陳小姐，美團外賣，3座12樓B室，ID card H456"
-    },
-    {
-        "name": "English Visit",
-        "building_id": 2,
-        "text": "John Smith visiting Block 1, 10th floor, Flat C, ID card B789"
-    },
-    {
-        "name": "Mixed Language Delivery",
-        "building_id": 2,
-        "text": "張先生 delivery food to Block 5, 20樓 Flat D, 身份證 C321, FoodPanda"
-    },
-    {
-        "name": "Building ID 1 Test",
-        "building_id": 1,
-        "text": "我叫李先生，送外賣到1座1樓B室，身份證A123，是熊猫外賣"
-    }
-]
+# Multiplex the concurrent requests over one HTTP/2 connection. Off by default
+# since uvicorn only speaks HTTP/1.1; pooled keep-alive connections are used then.
+HTTP2 = os.getenv("DEMO_HTTP2", "0") == "1"
+# --quiet drops the per-case JSON dumps
+VERBOSE = "--quiet" not in sys.argv[1:]
+MAX_ATTEMPTS = 4  # Tries per request for transient failures
+RETRY_BACKOFF_BASE = 0.5  # Seconds; doubles on each retry
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_TEXT_BODY = 64 * 1024  # Bytes of a non-JSON response body to keep
+# ETags and bodies of earlier GET responses, so repeat runs can get a 304 instead
+ETAG_CACHE_PATH = os.path.expanduser("~/.demo_etags.json")
+# POST bodies are sent pre-encoded, so the content type is set explicitly
+_JSON_HEADERS = {"Content-Type": "application/json"}
 
-async def test_api_endpoint(endpoint: str, method: str = "GET", data: Dict[Any, Any] = None) -> Dict[str, Any]:
-    """Test an API endpoint and return the result."""
+@dataclass(frozen=True, slots=True)
+class Case:
+    """One demo parse request."""
+    name: str
+    building_id: int
+    text: str
+
+TEST_CASES: Tuple[Case, ...] = (
+    Case(name="Chinese Delivery (FoodPanda)", building_id=2, text="我叫李先生，送外賣到2座15樓A室，身份證A123，是熊猫外賣"),
+    Case(name="Chinese Delivery (Keeta)", building_id=2, text="陳小姐，美團外賣，3座12樓B室，ID card H456"),
+    Case(name="English Visit", building_id=2, text="John Smith visiting Block 1, 10th floor, Flat C, ID card B789"),
+    Case(name="Mixed Language Delivery", building_id=2, text="張先生 delivery food to Block 5, 20樓 Flat D, 身份證 C321, FoodPanda"),
+    Case(name="Building ID 1 Test", building_id=1, text="我叫李先生，送外賣到1座1樓B室，身份證A123，是熊猫外賣"),
+)
+
+def _json_body(data: Any) -> bytes:
+    """Encode a POST body once, so retries resend the same bytes."""
+    return orjson.dumps(data)
+
+# The parse request body never changes, so it is encoded once at import
+BATCH_PAYLOAD = _json_body({
+    "items": [
+        {"building_id": test_case.building_id, "text": test_case.text}
+        for test_case in TEST_CASES
+    ]
+})
+
+# endpoint -> {"etag": ..., "data": ...}, loaded from and saved to ETAG_CACHE_PATH by run_demo
+_etags: Dict[str, Dict[str, Any]] = {}
+
+def _load_etags() -> None:
+    try:
+        with open(ETAG_CACHE_PATH, "rb") as f:
+            _etags.update(orjson.loads(f.read()))
+    except (OSError, orjson.JSONDecodeError):
+        pass  # No usable cache yet; every GET fetches the full body
+
+def _save_etags() -> None:
+    try:
+        with open(ETAG_CACHE_PATH, "wb") as f:
+            f.write(orjson.dumps(_etags))
+    except OSError:
+        pass
+
+async def test_api_endpoint(client: httpx.AsyncClient, endpoint: str, method: str = "GET", data: Dict[Any, Any] = None, content: Optional[bytes] = None) -> Dict[str, Any]:
+    """Test an API endpoint (relative to the client's /api/v1 base URL) and return the result.
+    
+    A POST body is given either as data or as already-encoded JSON content.
+    Transient failures (429/5xx, connection errors and read timeouts) are retried
+    with exponential backoff; "latency" is the total time including retries.
+    """
     
-    url = f"{BASE_URL}/api/v1{endpoint}"
+    started = time.perf_counter()
+    is_post = method.upper() == "POST"
+    if is_post:
+        content = content if content is not None else _json_body(data)
+        cached = None
+        headers = _JSON_HEADERS
+    else:
+        content = None
+        cached = _etags.get(endpoint)
+        headers = {"If-None-Match": cached["etag"]} if cached else None
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    for attempt in range(MAX_ATTEMPTS):
         try:
-            if method.upper() == "POST":
-                response = await client.post(url, json=data)
-            else:
-                response = await client.get(url)
+            async with client.stream(method.upper(), endpoint, content=content, headers=headers) as response:
+                if response.status_code in RETRY_STATUS_CODES and attempt < MAX_ATTEMPTS - 1:
+                    await asyncio.sleep(RETRY_BACKOFF_BASE * 2 ** attempt)
+                    continue
+                
+                if response.status_code == 304 and cached:
+                    # Not modified: reuse the body from the earlier response
+                    body = cached["data"]
+                else:
+                    body = await _read_body(response)
+                    etag = response.headers.get("etag")
+                    if not is_post and etag and response.status_code == 200:
+                        _etags[endpoint] = {"etag": etag, "data": body}
             
             return {
                 "success": True,
                 "status_code": response.status_code,
-                "data": response.json() if response.headers.get("content-type", "").startswith("application/json") else response.text
+                "latency": time.perf_counter() - started,
+                "data": body
             }
             
-        except httpx.ConnectError:
+        except (httpx.ConnectError, httpx.ReadTimeout) as e:
+            if attempt < MAX_ATTEMPTS - 1:
+                await asyncio.sleep(RETRY_BACKOFF_BASE * 2 ** attempt)
+                continue
+            if isinstance(e, httpx.ConnectError):
+                return {
+                    "success": False,
+                    "error": "connection_failed",
+                    "latency": time.perf_counter() - started,
+                    "data": f"Could not connect to {BASE_URL}. Make sure the API server is running."
+                }
             return {
                 "success": False,
-                "error": "connection_failed",
-                "data": f"Could not connect to {BASE_URL}. Make sure the API server is running."
+                "error": "timeout",
+                "latency": time.perf_counter() - started,
+                "data": "Request timed out after 30 seconds"
             }
         except httpx.TimeoutException:
             return {
                 "success": False,
                 "error": "timeout",
+                "latency": time.perf_counter() - started,
                 "data": "Request timed out after 30 seconds"
             }
         except Exception as e:
             return {
                 "success": False,
                 "error": "unknown",
+                "latency": time.perf_counter() - started,
                 "data": f"Unexpected error: {str(e)}"
             }
 
+def _pretty_json(value) -> str:
+    """Indented JSON with non-ASCII (Chinese) text kept readable."""
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode()
+
+async def _read_body(response: httpx.Response):
+    """Read a streamed response: JSON bodies are parsed in full, anything else
+    (e.g. an HTML error page) only up to MAX_TEXT_BODY bytes."""
+    if response.headers.get("content-type", "").startswith("application/json"):
+        return orjson.loads(await response.aread())
+    
+    chunks = []
+    size = 0
+    async for chunk in response.aiter_bytes(65536):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= MAX_TEXT_BODY:
+            break
+    return b"".join(chunks)[:MAX_TEXT_BODY].decode(response.encoding or "utf-8", errors="replace")
+
 async def run_demo():
     """Run the demo with all test cases."""
     
+    # One client for the whole demo, so every call reuses a kept-alive connection
+    async with httpx.AsyncClient(
+        base_url=f"{BASE_URL}/api/v1",
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        http2=HTTP2
+    ) as client:
+        _load_etags()
+        try:
+            await _run_demo(client)
+        finally:
+            _save_etags()
+
+async def _run_demo(client: httpx.AsyncClient):
     print("🤖 AI Visitor Registration API Demo")
     print("=" * 50)
     
     # Test 1: Health Check
     print("\n1. 🏥 Health Check")
-    health_result = await test_api_endpoint("/health")
+    health_result = await test_api_endpoint(client, "/health")
     
     if health_result["success"]:
         print(f"   ✅ API is healthy (Status: {health_result['status_code']})")
@@ -97,13 +199,15 @@ async def run_demo():
     
     # Test 2: Categories
     print("\n2. 📂 Get Categories")
-    categories_result = await test_api_endpoint("/categories")
+    categories_result = await test_api_endpoint(client, "/categories")
     
     if categories_result["success"]:
-        if categories_result["status_code"] == 200:
-            print(f"   ✅ Categories retrieved successfully")
+        if categories_result["status_code"] in (200, 304):
+            not_modified = " (not modified, cached copy)" if categories_result["status_code"] == 304 else ""
+            print(f"   ✅ Categories retrieved successfully{not_modified}")
             categories_data = categories_result["data"]
-            print(f"   📊 Categories: {json.dumps(categories_data, ensure_ascii=False, indent=6)}")
+            if VERBOSE:
+                print(f"   📊 Categories: {_pretty_json(categories_data)}")
         else:
             print(f"   ⚠️  Categories endpoint returned status {categories_result['status_code']}")
     else:
@@ -112,44 +216,52 @@ async def run_demo():
     # Test 3: Visitor Parsing
     print("\n3. 🧠 AI Visitor Information Parsing")
     print("   Testing multiple scenarios...")
+    print(f"   🤖 Processing {len(TEST_CASES)} cases with AI in one batch... (this may take 5-10 seconds)")
     
-    for i, test_case in enumerate(TEST_CASES, 1):
-        print(f"\n   Test Case {i}: {test_case['name']}")
-        print(f"   Input: {test_case['text']}")
-        print("   🤖 Processing with AI... (this may take 5-10 seconds)")
-        
-        parse_result = await test_api_endpoint(
-            "/parse-visitor",
-            method="POST",
-            data={
-                "building_id": test_case["building_id"],
-                "text": test_case["text"]
-            }
-        )
+    # One batch request; the server fetches each building once and runs the AI calls concurrently
+    batch_result = await test_api_endpoint(client, "/parse-visitor/batch", method="POST", content=BATCH_PAYLOAD)
+    
+    if batch_result["success"] and batch_result["status_code"] == 200:
+        parse_results = batch_result["data"]["results"]
+        print(f"   ⏱️  Parsed {len(parse_results)} cases in {batch_result['latency']:.2f}s")
+    else:
+        # Report the batch failure against every case
+        failure = batch_result["data"] if not batch_result["success"] else f"status {batch_result['status_code']}: {batch_result['data']}"
+        parse_results = [None] * len(TEST_CASES)
+    
+    # Lines are buffered and written once instead of flushing a print per line
+    lines = []
+    emit = lines.append
+    
+    for i, (test_case, result_data) in enumerate(zip(TEST_CASES, parse_results), 1):
+        emit(f"\n   Test Case {i}: {test_case.name}")
+        emit(f"   Input: {test_case.text}")
         
-        if parse_result["success"]:
-            result_data = parse_result["data"]
-            print(f"   ✅ Status: {result_data['status']}")
+        if result_data is None:
+            emit(f"   ❌ Request failed: {failure}")
+        else:
+            emit(f"   ✅ Status: {result_data['status']}")
             
             if result_data["status"] == "success":
                 data = result_data.get("data", {})
-                print(f"   📊 Confidence: {result_data.get('confidence', 0):.2f}")
-                print(f"   👤 Visitor: {data.get('visitor_name', 'N/A')}")
-                print(f"   🏢 Location: Block {data.get('block_id', 'N/A')}, Floor {data.get('floor_id', 'N/A')}, Flat {data.get('flat_id', 'N/A')}")
-                print(f"   🎯 Category: {data.get('main_category', 'N/A')}")
+                emit(f"   📊 Confidence: {result_data.get('confidence', 0):.2f}")
+                emit(f"   👤 Visitor: {data.get('visitor_name', 'N/A')}")
+                emit(f"   🏢 Location: Block {data.get('block_id', 'N/A')}, Floor {data.get('floor_id', 'N/A')}, Flat {data.get('flat_id', 'N/A')}")
+                emit(f"   🎯 Category: {data.get('main_category', 'N/A')}")
                 if data.get("sub_category"):
-                    print(f"   📱 Sub-category: {data.get('sub_category')}")
-                print(f"   🆔 ID: {data.get('id_card_prefix', 'N/A')}")
+                    emit(f"   📱 Sub-category: {data.get('sub_category')}")
+                emit(f"   🆔 ID: {data.get('id_card_prefix', 'N/A')}")
                 
                 # Show the actual JSON response that gets returned to the API caller
-                print(f"\n   📋 **JSON Response to API Caller:**")
-                print(f"   ```json")
-                print(f"   {json.dumps(result_data, indent=4, ensure_ascii=False)}")
-                print(f"   ```")
+                if VERBOSE:
+                    emit(f"\n   📋 **JSON Response to API Caller:**")
+                    emit(f"   ```json")
+                    emit(f"   {_pretty_json(result_data)}")
+                    emit(f"   ```")
             else:
-                print(f"   ❌ Error: {result_data.get('message', 'Unknown error')}")
-        else:
-            print(f"   ❌ Request failed: {parse_result['data']}")
+                emit(f"   ❌ Error: {result_data.get('message', 'Unknown error')}")
+    
+    sys.stdout.write("\n".join(lines) + "\n")
     
     print("\n" + "=" * 50)
     print("🎉 Demo completed!")
@@ -164,6 +276,13 @@ if __name__ == "__main__":
     print("Run: python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload")
     print("\nPress Enter to continue or Ctrl+C to cancel...")
     
+    try:
+        # libuv event loop where available (uvloop is not installed on Windows)
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     try:
         input()
         asyncio.run(run_demo())
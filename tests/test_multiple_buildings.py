@@ -9,6 +9,7 @@ import json
 import logging
 import sys
 import os
+from dataclasses import dataclass
 from datetime import datetime
 
 # Add parent directory to path so we can import from app
@@ -25,21 +26,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@dataclass(frozen=True, slots=True)
+class Case:
+    """One visitor text parsed against every test building."""
+    description: str
+    text: str
+
+# Services shared by every tester in this process, created on first use
+_shared_services = None
+
+def get_shared_services():
+    """Get the (WhizPropClient, GeminiService, VisitorParserService) shared by all testers.
+    
+    The parser uses the same client and service, so its building cache serves
+    both the structure check and the parse cases.
+    """
+    global _shared_services
+    if _shared_services is None:
+        whizprop_client = WhizPropClient()
+        gemini_service = GeminiService()
+        parser_service = VisitorParserService(gemini_service=gemini_service, whizprop_client=whizprop_client)
+        _shared_services = (whizprop_client, gemini_service, parser_service)
+    return _shared_services
+
+async def close_shared_services():
+    """Close the shared services' HTTP clients (a later tester creates new ones)."""
+    global _shared_services
+    if _shared_services is not None:
+        whizprop_client, gemini_service, _ = _shared_services
+        _shared_services = None
+        await whizprop_client.aclose()
+        await gemini_service.aclose()
+
 class MultiBuildingTester:
     def __init__(self):
-        self.whizprop_client = WhizPropClient()
-        self.gemini_service = GeminiService()
-        self.parser_service = VisitorParserService()
-        
+        self.whizprop_client, self.gemini_service, self.parser_service = get_shared_services()
+    
     async def test_building_structure(self, building_id: int):
         """Test and display building structure for a given building ID."""
         
-        print(f"\n🏢 Testing Building ID: {building_id}")
-        print("-" * 50)
-        
         try:
             # Get building data
-            building_data = await self.whizprop_client.get_building_settings(building_id)
+            building_data = await self.parser_service.buildings.get(building_id)
+            
+            print(f"\n{'='*20} BUILDING {building_id} TESTING {'='*20}")
+            print(f"\n🏢 Testing Building ID: {building_id}")
+            print("-" * 50)
             
             # Display structure
             print(f"📊 Building Structure:")
@@ -74,64 +106,68 @@ class MultiBuildingTester:
             return building_data
             
         except Exception as e:
+            print(f"\n{'='*20} BUILDING {building_id} TESTING {'='*20}")
             print(f"❌ Failed to get building {building_id} data: {str(e)}")
             return None
     
     async def test_visitor_parsing(self, building_id: int, building_data, test_cases):
         """Test visitor parsing for a specific building."""
         
-        print(f"\n🧠 Testing AI Parsing for Building {building_id}")
-        print("-" * 50)
+        # Run every case at once; results are printed below in case order
+        results = await asyncio.gather(
+            *(self.parser_service.parse_visitor_info(building_id, tc.text) for tc in test_cases),
+            return_exceptions=True,
+        )
         
-        for i, test_case in enumerate(test_cases, 1):
-            print(f"\n   Test {i}: {test_case['description']}")
-            print(f"   Input: {test_case['text']}")
+        # Lines are buffered and written once instead of flushing a print per line
+        lines = [f"\n🧠 Testing AI Parsing for Building {building_id}", "-" * 50]
+        emit = lines.append
+        
+        for i, (test_case, result) in enumerate(zip(test_cases, results), 1):
+            emit(f"\n   Test {i}: {test_case.description}")
+            emit(f"   Input: {test_case.text}")
             
             try:
-                # Test the parser service directly
-                result = await self.parser_service.parse_visitor_info(building_id, test_case['text'])
+                if isinstance(result, Exception):
+                    raise result
                 
                 if hasattr(result, 'status') and result.status == "success":
                     data = result.data
-                    print(f"   ✅ Success (Confidence: {result.confidence:.2f})")
-                    print(f"   👤 Visitor: {data.visitor_name}")
-                    print(f"   🏢 Location: Block {data.block_id}, Floor {data.floor_id}, Flat {data.flat_id}")
-                    print(f"   🎯 Category: {data.main_category}")
+                    emit(f"   ✅ Success (Confidence: {result.confidence:.2f})")
+                    emit(f"   👤 Visitor: {data.visitor_name}")
+                    emit(f"   🏢 Location: Block {data.block_id}, Floor {data.floor_id}, Flat {data.flat_id}")
+                    emit(f"   🎯 Category: {data.main_category}")
                     if data.sub_category:
-                        print(f"   📱 Sub-category: {data.sub_category}")
-                    print(f"   🆔 ID: {data.id_card_prefix}")
+                        emit(f"   📱 Sub-category: {data.sub_category}")
+                    emit(f"   🆔 ID: {data.id_card_prefix}")
                     
                     # Validate the IDs exist in building data
                     validation_errors = []
                     
                     # Check block ID
-                    if data.block_id:
-                        block_exists = any(b.Id == data.block_id for b in building_data.BlockList)
-                        if not block_exists:
-                            validation_errors.append(f"Block ID {data.block_id} not found")
+                    if data.block_id and data.block_id not in building_data.blocks_by_id:
+                        validation_errors.append(f"Block ID {data.block_id} not found")
                     
                     # Check floor ID
-                    if data.floor_id:
-                        floor_exists = any(f.Id == data.floor_id for f in building_data.FloorList)
-                        if not floor_exists:
-                            validation_errors.append(f"Floor ID {data.floor_id} not found")
+                    if data.floor_id and data.floor_id not in building_data.floors_by_id:
+                        validation_errors.append(f"Floor ID {data.floor_id} not found")
                     
                     # Check flat ID
-                    if data.flat_id:
-                        flat_exists = any(u.Id == data.flat_id for u in building_data.UnitList)
-                        if not flat_exists:
-                            validation_errors.append(f"Flat ID {data.flat_id} not found")
+                    if data.flat_id and data.flat_id not in building_data.flats_by_id:
+                        validation_errors.append(f"Flat ID {data.flat_id} not found")
                     
                     if validation_errors:
-                        print(f"   ⚠️  Validation Issues: {', '.join(validation_errors)}")
+                        emit(f"   ⚠️  Validation Issues: {', '.join(validation_errors)}")
                     else:
-                        print(f"   ✅ All IDs validated successfully")
+                        emit(f"   ✅ All IDs validated successfully")
                         
                 else:
-                    print(f"   ❌ Failed: {result.message if hasattr(result, 'message') else 'Unknown error'}")
+                    emit(f"   ❌ Failed: {result.message if hasattr(result, 'message') else 'Unknown error'}")
                     
             except Exception as e:
-                print(f"   💥 Exception: {str(e)}")
+                emit(f"   💥 Exception: {str(e)}")
+        
+        sys.stdout.write("\n".join(lines) + "\n")
     
     async def run_comprehensive_test(self):
         """Run comprehensive tests across multiple buildings."""
@@ -144,36 +180,25 @@ class MultiBuildingTester:
         test_buildings = [1, 2]  # Add more building IDs as needed
         
         # Test cases for each building
-        test_cases = [
-            {
-                "description": "Chinese delivery to first block, first floor",
-                "text": "我叫李先生，送外賣到1座1樓A室，身份證A123，是熊猫外賣"
-            },
-            {
-                "description": "Chinese delivery to first block, ground floor", 
-                "text": "陳小姐，美團外賣，1座地下A室，ID card H456"
-            },
-            {
-                "description": "English visit to second block",
-                "text": "John Smith visiting Block 2, 5th floor, Flat B, ID card B789"
-            },
-            {
-                "description": "Mixed language delivery",
-                "text": "張先生 delivery food to 2座 10樓 C室, 身份證 C321, FoodPanda"
-            }
-        ]
+        test_cases = (
+            Case(description="Chinese delivery to first block, first floor", text="我叫李先生，送外賣到1座1樓A室，身份證A123，是熊猫外賣"),
+            Case(description="Chinese delivery to first block, ground floor", text="陳小姐，美團外賣，1座地下A室，ID card H456"),
+            Case(description="English visit to second block", text="John Smith visiting Block 2, 5th floor, Flat B, ID card B789"),
+            Case(description="Mixed language delivery", text="張先生 delivery food to 2座 10樓 C室, 身份證 C321, FoodPanda"),
+        )
         
         all_results = {}
         
-        for building_id in test_buildings:
-            print(f"\n{'='*20} BUILDING {building_id} TESTING {'='*20}")
-            
-            # Test building structure
-            building_data = await self.test_building_structure(building_id)
-            
+        # Fetch every building's structure concurrently, then parse the test
+        # cases for all buildings that loaded. Each step prints its block only
+        # after its awaits finish, so the output sections don't interleave.
+        structures = await asyncio.gather(*(self.test_building_structure(b) for b in test_buildings))
+        
+        loaded = [(b, data) for b, data in zip(test_buildings, structures) if data]
+        await asyncio.gather(*(self.test_visitor_parsing(b, data, test_cases) for b, data in loaded))
+        
+        for building_id, building_data in zip(test_buildings, structures):
             if building_data:
-                # Test visitor parsing
-                await self.test_visitor_parsing(building_id, building_data, test_cases)
                 all_results[building_id] = "PASSED"
             else:
                 all_results[building_id] = "FAILED - Could not get building data"
@@ -202,13 +227,23 @@ class MultiBuildingTester:
 async def main():
     """Main test function."""
     tester = MultiBuildingTester()
-    await tester.run_comprehensive_test()
+    try:
+        await tester.run_comprehensive_test()
+    finally:
+        await close_shared_services()
 
 if __name__ == "__main__":
     print("🔧 Multi-Building Test Suite for AI Visitor Registration")
     print("This will test the system with different building structures")
     print("\nPress Enter to start testing or Ctrl+C to cancel...")
     
+    try:
+        # libuv event loop where available (uvloop is not installed on Windows)
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     try:
         input()
         asyncio.run(main())